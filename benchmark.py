@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Density-Temperature Lookup Application
+
+Times ingest, lookup and chart building on synthetic tables generated with
+the same formula as create_sample_data.py, and prints one JSON object per
+measurement so results can be collected and compared across versions.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 1000 100000 10000000 --output results.jsonl
+"""
+
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly.io
+
+from create_sample_data import generate_sample_data
+from data_loading import SnapshotStore, file_content_hash, stream_excel
+from density_lookup import ENGINES, create_engine
+from parallel_lookup import ParallelBatchExecutor
+from plotting import create_scatter_plot
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+MAX_EXCEL_ROWS = 100_000  # Writing larger workbooks takes longer than the benchmark itself
+MAX_BRUTE_FORCE_ROWS = 1_000_000  # Brute force batches above this are too slow to be useful
+SINGLE_QUERIES = 200  # Single lookups timed per engine
+BATCH_QUERIES = 100_000  # Query rows per batch lookup
+BRUTE_FORCE_BATCH_QUERIES = 1_000  # Brute force scans every row per query, so it gets fewer
+PARALLEL_BATCH_QUERIES = 2_000_000  # Query rows per parallel batch lookup
+REPEATS = 3  # Best-of repeats for each timing
+
+
+def best_time(func, repeats=REPEATS):
+    """Fastest wall-clock time of several runs, in seconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def git_version():
+    """Current commit, so results can be matched to a version"""
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def random_queries(n_queries, seed=0):
+    """Query pairs spread over the same range as the generated tables"""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.8, 1.2, n_queries), rng.uniform(15, 35, n_queries)
+
+
+def bench_ingest(data, repeats):
+    """pd.read_excel against the streaming loader and the on-disk snapshot"""
+    workbook = io.BytesIO()
+    data.to_excel(workbook, index=False)
+    content = workbook.getvalue()
+
+    yield 'ingest', 'read_excel', best_time(lambda: pd.read_excel(io.BytesIO(content)), repeats)
+    yield 'ingest', 'stream_excel', best_time(lambda: stream_excel(io.BytesIO(content)), repeats)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = SnapshotStore(root)
+        content_hash = file_content_hash(content)
+        store.save(content_hash, data)
+        yield 'ingest', 'snapshot', best_time(lambda: store.load(content_hash), repeats)
+
+
+def bench_lookup(data, engines, repeats, workers=1):
+    """Build, single-query and batch-query time for each engine, plus parallel batches if workers > 1"""
+    single_md, single_ot = random_queries(SINGLE_QUERIES, seed=1)
+
+    for name in engines:
+        if name == 'brute' and len(data) > MAX_BRUTE_FORCE_ROWS:
+            continue
+        n_batch = BRUTE_FORCE_BATCH_QUERIES if name == 'brute' else BATCH_QUERIES
+        batch_md, batch_ot = random_queries(n_batch, seed=2)
+
+        yield 'build', name, best_time(lambda: create_engine(data, name), repeats)
+        engine = create_engine(data, name)
+
+        def single_lookups():
+            for md, ot in zip(single_md, single_ot):
+                engine.query(md, ot)
+
+        yield 'lookup_single', name, best_time(single_lookups, repeats) / SINGLE_QUERIES
+        yield 'lookup_batch', name, best_time(lambda: engine.query_batch(batch_md, batch_ot), repeats) / n_batch
+
+        # Engines that keep no rows (the fitted model) cannot be shared with workers
+        if workers > 1 and name != 'brute' and len(engine.points):
+            parallel_md, parallel_ot = random_queries(PARALLEL_BATCH_QUERIES, seed=3)
+            # Pool start-up is paid once, outside the timing
+            with ParallelBatchExecutor(engine, workers) as executor:
+                seconds = best_time(lambda: executor.query_batch(parallel_md, parallel_ot), repeats)
+            yield f'lookup_parallel_{workers}', name, seconds / PARALLEL_BATCH_QUERIES
+
+
+def bench_render(data, repeats):
+    """Figure build and JSON serialization time"""
+    yield 'render_build', 'create_scatter_plot', best_time(lambda: create_scatter_plot(data), repeats)
+    fig = create_scatter_plot(data)
+    yield 'render_serialize', 'to_json', best_time(lambda: plotly.io.to_json(fig, validate=False), repeats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, lookup and render paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Table sizes in rows")
+    parser.add_argument('--engines', nargs='+', default=sorted(ENGINES), choices=sorted(ENGINES),
+                        help="Lookup engines to benchmark")
+    parser.add_argument('--repeats', type=int, default=REPEATS,
+                        help="Runs per timing; the fastest is reported")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Also time parallel batch lookups with this many worker processes")
+    parser.add_argument('--output', help="Append results to this JSON lines file instead of stdout")
+    args = parser.parse_args()
+
+    run = {
+        'version': git_version(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+    output = open(args.output, 'a') if args.output else sys.stdout
+
+    try:
+        for size in args.sizes:
+            data = generate_sample_data(size)
+            benchmarks = [bench_lookup(data, args.engines, args.repeats, args.workers), bench_render(data, args.repeats)]
+            if size <= MAX_EXCEL_ROWS:
+                benchmarks.insert(0, bench_ingest(data, args.repeats))
+
+            for benchmark in benchmarks:
+                for phase, variant, seconds in benchmark:
+                    record = dict(run, rows=size, phase=phase, variant=variant, seconds=seconds)
+                    output.write(json.dumps(record) + '\n')
+                    output.flush()
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
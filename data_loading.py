@@ -0,0 +1,357 @@
+"""
+Data loading helpers for the Density-Temperature Lookup Application
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from density_lookup import REQUIRED_COLUMNS, validate_data_structure
+
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256MB of parsed tables kept in memory
+SNAPSHOT_DIR = os.environ.get('DENSITY_SNAPSHOT_DIR', '.density_cache')
+STREAM_CHUNK_ROWS = 10_000  # Workbook rows coerced to numbers per chunk
+DATASET_DTYPE = os.environ.get('DENSITY_DATASET_DTYPE', 'float64')  # 'float32' halves table memory
+SNAPSHOT_MAX_BYTES = int(os.environ.get('DENSITY_SNAPSHOT_MAX_MB', 2048)) * 1024**2  # 0 keeps every snapshot
+STAGING_MAX_AGE_SECONDS = 60 * 60  # Leftovers of interrupted writes older than this are removed
+
+# One memory-mappable .npy file per required column
+SNAPSHOT_FILES = {
+    'Measured Density': 'measured_density.npy',
+    'Observed Temperature': 'observed_temperature.npy',
+    'Corresponding Density': 'corresponding_density.npy'
+}
+# Arrays a lookup engine is rebuilt from, see LookupEngine.from_scaled
+ENGINE_ARRAYS = ('points', 'corresponding', 'transform')
+
+
+def file_content_hash(content: bytes) -> str:
+    """Hash uploaded file content using SHA-256"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ParseCache:
+    """Size-bounded LRU cache of parsed workbooks keyed by content hash"""
+
+    def __init__(self, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, content_hash: str) -> Optional[pd.DataFrame]:
+        with self.lock:
+            entry = self.entries.get(content_hash)
+            if entry is None:
+                return None
+            self.entries.move_to_end(content_hash)
+            return entry[0]
+
+    def put(self, content_hash: str, data: pd.DataFrame):
+        size = int(data.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            if content_hash in self.entries:
+                self.total_bytes -= self.entries.pop(content_hash)[1]
+            self.entries[content_hash] = (data, size)
+            self.total_bytes += size
+
+            # Evict least recently used tables, but always keep the newest one
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+def directory_size(path: str) -> int:
+    """Total size of the files under a directory"""
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
+
+
+class SnapshotStore:
+    """Content-addressed on-disk columnar snapshots of validated reference tables
+
+    The store is bounded: after each write, the least recently used
+    snapshots are removed until it fits in max_bytes.
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, max_bytes: int = SNAPSHOT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash)
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.isdir(self.path_for(content_hash))
+
+    def load(self, content_hash: str) -> Optional[pd.DataFrame]:
+        """Memory-map a snapshot instead of parsing the workbook again"""
+        path = self.path_for(content_hash)
+        try:
+            columns = {
+                col: np.load(os.path.join(path, name), mmap_mode='r')
+                for col, name in SNAPSHOT_FILES.items()
+            }
+        except (OSError, ValueError):
+            return None
+        if any(values.dtype != np.float64 for values in columns.values()):
+            # Written by an older version in the configured dataset dtype; not lossless
+            return None
+        try:
+            # The directory's modification time records its last use, for prune()
+            os.utime(path)
+        except OSError:
+            pass
+        return pd.DataFrame(columns, copy=False)
+
+    def remove(self, content_hash: str):
+        """Delete a snapshot and the engine arrays saved with it"""
+        try:
+            # Moved aside first, so other processes never see it half deleted
+            trash = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+            os.rename(self.path_for(content_hash), os.path.join(trash, content_hash))
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def prune(self, keep: Optional[str] = None) -> int:
+        """Remove least recently used snapshots until the store fits in max_bytes; returns how many
+
+        Processes that have a removed snapshot memory-mapped keep their copy
+        until they let go of it. Leftovers of interrupted writes are removed too.
+        """
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return 0
+
+        now = time.time()
+        snapshots = []
+        for entry in entries:
+            try:
+                if not entry.is_dir():
+                    continue
+                modified = entry.stat().st_mtime
+                if entry.name.startswith('.staging-'):
+                    if now - modified > STAGING_MAX_AGE_SECONDS:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                snapshots.append((modified, entry.name, directory_size(entry.path)))
+            except OSError:
+                continue
+
+        if not self.max_bytes:
+            return 0
+        total = sum(size for _, _, size in snapshots)
+        removed = 0
+        for _, content_hash, size in sorted(snapshots):
+            if total <= self.max_bytes:
+                break
+            if content_hash == keep:
+                continue
+            self.remove(content_hash)
+            total -= size
+            removed += 1
+        return removed
+
+    def engine_path(self, content_hash: str, key: str) -> str:
+        return os.path.join(self.path_for(content_hash), f"engine-{key}")
+
+    def load_engine(self, content_hash: str, key: str) -> Optional[dict]:
+        """Scaled engine arrays saved next to a snapshot, memory-mapped
+
+        They are plain .npy files loaded without pickle support, so a file
+        planted in the shared directory can at worst give wrong arrays, never
+        run code. 'transform' is None for metrics that do not scale the axes.
+        """
+        path = self.engine_path(content_hash, key)
+        arrays = {}
+        try:
+            for name in ENGINE_ARRAYS:
+                file_path = os.path.join(path, f"{name}.npy")
+                if name == 'transform' and not os.path.exists(file_path):
+                    arrays[name] = None
+                    continue
+                arrays[name] = np.load(file_path, mmap_mode='r', allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        return arrays
+
+    def save_engine(self, content_hash: str, key: str, arrays: dict) -> bool:
+        """Save an engine's scaled arrays beside its snapshot; needs the snapshot to exist"""
+        if not self.exists(content_hash) or os.path.isdir(self.engine_path(content_hash, key)):
+            return self.exists(content_hash)
+        try:
+            staging = tempfile.mkdtemp(dir=self.path_for(content_hash), prefix='.staging-')
+        except OSError:
+            return False
+        try:
+            for name in ENGINE_ARRAYS:
+                if arrays.get(name) is not None:
+                    np.save(os.path.join(staging, f"{name}.npy"), np.asarray(arrays[name]), allow_pickle=False)
+            # Publish atomically so other processes never read a partial engine
+            os.rename(staging, self.engine_path(content_hash, key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        self.prune(keep=content_hash)
+        return True
+
+    def save(self, content_hash: str, data: pd.DataFrame) -> bool:
+        """Write the required columns of a validated table as a float64 snapshot
+
+        Snapshots always hold the values as parsed; the configured dataset
+        dtype is applied when they are loaded, so processes with different
+        settings can share them.
+        """
+        if self.exists(content_hash):
+            if self.load(content_hash) is not None:
+                return True
+            self.remove(content_hash)
+        try:
+            columns = {col: np.ascontiguousarray(data[col].to_numpy(), dtype=np.float64) for col in SNAPSHOT_FILES}
+        except (TypeError, ValueError):
+            # Non-numeric columns cannot be snapshotted
+            return False
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+        try:
+            for col, name in SNAPSHOT_FILES.items():
+                np.save(os.path.join(staging, name), columns[col])
+            # Publish atomically so other sessions never see a partial snapshot
+            os.rename(staging, self.path_for(content_hash))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return self.exists(content_hash)
+        self.prune(keep=content_hash)
+        return True
+
+
+# Shared by every session and rerun in this process
+parse_cache = ParseCache()
+snapshot_store = SnapshotStore()
+
+
+def stream_excel(source, progress: Optional[Callable[[int, Optional[int]], None]] = None,
+                 chunk_rows: int = STREAM_CHUNK_ROWS) -> pd.DataFrame:
+    """Read the required columns of an xlsx workbook row by row in read-only mode
+
+    The header row is checked before any data is read. If a required column is
+    missing, an empty frame with the header's columns is returned so that
+    callers' validation rejects it without paying for the rest of the file.
+    """
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        # The first sheet, as pd.read_excel reads, whichever tab was active when the file was saved
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else '' for cell in next(rows, ())]
+        if not all(col in header for col in REQUIRED_COLUMNS):
+            return pd.DataFrame(columns=header)
+        positions = [header.index(col) for col in REQUIRED_COLUMNS]
+
+        # The sheet dimension is only a hint; arrays grow if it is missing or wrong
+        max_row = sheet.max_row
+        total_rows = max_row - 1 if max_row else None
+        columns = np.empty((len(REQUIRED_COLUMNS), max(total_rows or 0, chunk_rows)))
+        rows_read = 0
+        chunk = []
+
+        def flush():
+            nonlocal columns, rows_read
+            while rows_read + len(chunk) > columns.shape[1]:
+                columns = np.concatenate([columns, np.empty_like(columns)], axis=1)
+            for i, values in enumerate(zip(*chunk)):
+                columns[i, rows_read:rows_read + len(chunk)] = pd.to_numeric(
+                    pd.Series(values, dtype=object), errors='coerce'
+                )
+            rows_read += len(chunk)
+            chunk.clear()
+            if progress is not None:
+                progress(rows_read, total_rows)
+
+        for row in rows:
+            values = tuple(row[pos] if pos < len(row) else None for pos in positions)
+            if all(value is None for value in values):
+                continue
+            chunk.append(values)
+            if len(chunk) == chunk_rows:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        workbook.close()
+
+    return pd.DataFrame({col: columns[i, :rows_read] for i, col in enumerate(REQUIRED_COLUMNS)})
+
+
+def compact_table(data: pd.DataFrame, dtype: str = DATASET_DTYPE) -> pd.DataFrame:
+    """Only the required columns, each one contiguous numeric array of the given dtype
+
+    Extra workbook columns are dropped and unparseable cells become NaN, so no
+    per-row Python objects outlive parsing. Columns already in the right
+    dtype, such as memory-mapped snapshots, are not copied.
+    """
+    columns = {}
+    for col in REQUIRED_COLUMNS:
+        values = data[col]
+        # to_numeric always copies, so only columns that need coercing go through it
+        if not pd.api.types.is_numeric_dtype(values):
+            values = pd.to_numeric(values, errors='coerce')
+        columns[col] = np.ascontiguousarray(values.to_numpy(), dtype=dtype)
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_reference_table(content: bytes, content_hash: Optional[str] = None,
+                         progress: Optional[Callable[[int, Optional[int]], None]] = None) -> pd.DataFrame:
+    """Load a reference table from memory, an on-disk snapshot or the workbook itself
+
+    Valid tables are returned in compact form (see compact_table); invalid
+    ones are returned as parsed so callers can report what is missing.
+    """
+    if content_hash is None:
+        content_hash = file_content_hash(content)
+
+    data = parse_cache.get(content_hash)
+    if data is not None:
+        return data
+
+    data = snapshot_store.load(content_hash)
+    if data is None:
+        if content.startswith(b'PK'):
+            # xlsx is a zip archive and can be streamed; legacy xls cannot
+            data = stream_excel(io.BytesIO(content), progress=progress)
+        else:
+            data = pd.read_excel(io.BytesIO(content))
+        if validate_data_structure(data):
+            # The snapshot keeps full precision whatever DATASET_DTYPE is
+            data = compact_table(data, 'float64')
+            snapshot_store.save(content_hash, data)
+            data = compact_table(data)
+    else:
+        data = compact_table(data)
+
+    parse_cache.put(content_hash, data)
+    return data
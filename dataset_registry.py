@@ -0,0 +1,173 @@
+"""
+Process-wide registry of loaded reference datasets
+
+Sessions that load the same table share one parsed table, lookup engine and
+surrogate model instead of building their own. Each session holds a
+DatasetHandle; an entry is dropped as soon as the last handle referring to
+it is released or garbage collected with its session.
+"""
+
+import threading
+import weakref
+from typing import Optional
+
+import pandas as pd
+
+from data_loading import snapshot_store
+from density_lookup import (
+    DEFAULT_AXIS_WEIGHTS, DEFAULT_ENGINE, DEFAULT_METRIC, ENGINES, LookupEngine, SurrogateModel, create_engine,
+    fit_surrogate
+)
+
+
+def engine_cache_key(data: pd.DataFrame) -> str:
+    """Every setting the configured engine's scaled arrays depend on
+
+    Only the scaled rows are cached; indexes are rebuilt from them by the
+    current code, so the key never goes stale when an index changes. The
+    model engine keeps no rows and is never cached.
+    """
+    weights = '_'.join(f'{weight:g}' for weight in DEFAULT_AXIS_WEIGHTS)
+    dtype = data['Measured Density'].dtype
+    return f"{DEFAULT_ENGINE}-{DEFAULT_METRIC}-{weights}-{dtype}"
+
+
+class SharedDataset:
+    """Table, lookup engine and surrogate model built once per content hash
+
+    The arrays are made read-only, since every session sharing the dataset
+    reads them concurrently.
+    """
+
+    def __init__(self, content_hash: str, data: pd.DataFrame, engine: LookupEngine, model: SurrogateModel):
+        self.content_hash = content_hash
+        self.data = data
+        self.engine = engine
+        self.model = model
+        for array in (engine.points, engine.corresponding):
+            array.flags.writeable = False
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the table, engine and model together"""
+        return int(self.data.memory_usage(index=True).sum()) + self.engine.nbytes()
+
+    @classmethod
+    def build(cls, content_hash: str, data: pd.DataFrame) -> 'SharedDataset':
+        # Scaled arrays are saved beside the table's snapshot, so other processes and replicas reuse them
+        key = engine_cache_key(data)
+        arrays = snapshot_store.load_engine(content_hash, key)
+        if arrays is not None:
+            engine = ENGINES[DEFAULT_ENGINE].from_scaled(
+                arrays['points'], arrays['corresponding'], arrays['transform'], DEFAULT_METRIC, DEFAULT_AXIS_WEIGHTS
+            )
+        else:
+            engine = create_engine(data)
+            if len(engine.points):
+                snapshot_store.save_engine(content_hash, key, {
+                    'points': engine.points, 'corresponding': engine.corresponding, 'transform': engine.transform
+                })
+        return cls(content_hash, data, engine, fit_surrogate(data, engine))
+
+
+class RegistryEntry:
+    def __init__(self):
+        self.dataset = None
+        self.refs = 0
+        # Held while the dataset is built, so concurrent sessions build it only once
+        self.build_lock = threading.Lock()
+
+
+class DatasetHandle:
+    """A session's reference to a shared dataset"""
+
+    def __init__(self, registry: 'DatasetRegistry', content_hash: str):
+        self.content_hash = content_hash
+        self.dataset = None
+        # Released explicitly when the session switches tables, or when the session is collected
+        self.finalizer = weakref.finalize(self, registry.release, content_hash)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        return self.dataset.data
+
+    @property
+    def engine(self) -> LookupEngine:
+        return self.dataset.engine
+
+    @property
+    def model(self) -> SurrogateModel:
+        return self.dataset.model
+
+    def release(self):
+        """Drop this session's reference; safe to call more than once"""
+        self.finalizer()
+        self.dataset = None
+
+
+class DatasetRegistry:
+    """Reference-counted datasets keyed by content hash"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, content_hash: str, data: Optional[pd.DataFrame] = None) -> Optional[DatasetHandle]:
+        """Handle to the dataset for a content hash, built from data if it is not registered yet
+
+        Returns None if the dataset is not registered and no data is given.
+        """
+        with self.lock:
+            entry = self.entries.get(content_hash)
+            if entry is None:
+                if data is None:
+                    return None
+                entry = self.entries[content_hash] = RegistryEntry()
+            entry.refs += 1
+        handle = DatasetHandle(self, content_hash)
+
+        try:
+            with entry.build_lock:
+                if entry.dataset is None and data is not None:
+                    entry.dataset = SharedDataset.build(content_hash, data)
+        except Exception:
+            handle.release()
+            raise
+
+        if entry.dataset is None:
+            # Another session's build failed while this one waited
+            handle.release()
+            return None
+        handle.dataset = entry.dataset
+        return handle
+
+    def release(self, content_hash: str):
+        with self.lock:
+            entry = self.entries.get(content_hash)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                del self.entries[content_hash]
+
+    def references(self, content_hash: str) -> int:
+        with self.lock:
+            entry = self.entries.get(content_hash)
+            return entry.refs if entry is not None else 0
+
+    def stats(self) -> pd.DataFrame:
+        """One row per registered dataset"""
+        with self.lock:
+            rows = [
+                {
+                    'Dataset': content_hash[:12],
+                    'Rows': len(entry.dataset.data) if entry.dataset is not None else 0,
+                    'Sessions': entry.refs,
+                    'Memory (MB)': entry.dataset.nbytes() / 1024**2 if entry.dataset is not None else 0.0
+                }
+                for content_hash, entry in self.entries.items()
+            ]
+        return pd.DataFrame(rows, columns=['Dataset', 'Rows', 'Sessions', 'Memory (MB)'])
+
+
+# Shared by every session and rerun in this process
+dataset_registry = DatasetRegistry()
@@ -0,0 +1,702 @@
+"""
+Shared lookup core for the Density-Temperature Lookup Application
+
+Every front end resolves (Measured Density, Observed Temperature) queries
+through a LookupEngine. Engines are registered by name so a deployment can
+pick one with the DENSITY_LOOKUP_ENGINE environment variable.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy.spatial import Delaunay, QhullError, cKDTree
+from typing import Optional, Sequence, Tuple
+
+
+def check_axis_weights(weights: Sequence) -> Tuple[float, float]:
+    """Density and temperature weights as two positive floats; raises ValueError otherwise"""
+    try:
+        values = tuple(float(weight) for weight in weights)
+    except (TypeError, ValueError):
+        values = ()
+    if len(values) != 2 or not all(math.isfinite(value) and value > 0 for value in values):
+        raise ValueError(
+            f"Axis weights must be two positive numbers (density, temperature), e.g. DENSITY_AXIS_WEIGHTS=1,0.01; "
+            f"got {list(weights)!r}"
+        )
+    return values
+
+
+REQUIRED_COLUMNS = ['Measured Density', 'Observed Temperature', 'Corresponding Density']
+QUERY_COLUMNS = ['Measured Density', 'Observed Temperature']
+BATCH_CHUNK_SIZE = 100_000  # Query rows resolved per vectorized pass
+BRUTE_FORCE_BLOCK = 4_000_000  # Distance matrix elements computed at once by the brute force engine
+INTERPOLATION_NEIGHBOURS = 4  # Rows blended by the interpolating engine
+DEFAULT_ENGINE = os.environ.get('DENSITY_LOOKUP_ENGINE', 'indexed')
+LOOKUP_CACHE_SIZE = 1024  # Memoized lookup results kept per cache
+DENSITY_DECIMALS = 4  # Lookup cache quantization, matching the "%.4f" density input
+TEMPERATURE_DECIMALS = 2  # Lookup cache quantization, matching the "%.2f" temperature input
+GRID_MIN_COVERAGE = 0.9  # Fraction of grid nodes that must be present to treat a table as a grid
+GRID_TOLERANCE = 1e-6  # Allowed offset from a grid node, as a fraction of the grid step
+DEFAULT_METRIC = os.environ.get('DENSITY_DISTANCE_METRIC', 'euclidean')
+DEFAULT_AXIS_WEIGHTS = check_axis_weights(os.environ.get('DENSITY_AXIS_WEIGHTS', '1,1').split(','))
+METRICS = ['euclidean', 'standardized', 'weighted', 'mahalanobis']
+SURROGATE_DEGREE = int(os.environ.get('DENSITY_SURROGATE_DEGREE', 3))  # Total degree of the fitted polynomial surface
+
+
+def validate_data_structure(data: pd.DataFrame) -> bool:
+    """Validate that the data has the required columns"""
+    if data is None:
+        return False
+    return all(col in data.columns for col in REQUIRED_COLUMNS)
+
+
+def float_array(values) -> np.ndarray:
+    """Column or table values as floats, keeping float32 instead of widening it"""
+    array = np.asarray(values)
+    return array if array.dtype in (np.float32, np.float64) else array.astype(float)
+
+
+def axis_transform(points: np.ndarray, metric: str = DEFAULT_METRIC,
+                   weights: Tuple[float, float] = DEFAULT_AXIS_WEIGHTS) -> Optional[np.ndarray]:
+    """2x2 matrix mapping (density, temperature) into the space distances are measured in
+
+    None means raw Euclidean distance. 'standardized' divides each axis by its
+    standard deviation, 'weighted' multiplies each axis by a user weight and
+    'mahalanobis' whitens by the inverse covariance of the table.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown distance metric '{metric}'. Available metrics: {', '.join(METRICS)}")
+    if metric == 'euclidean':
+        return None
+    if metric == 'weighted':
+        return np.diag(check_axis_weights(weights))
+
+    if len(points) < 2:
+        return None
+    if metric == 'standardized':
+        std = points.std(axis=0)
+        return np.diag(1.0 / np.where(std > 0, std, 1.0))
+
+    # Mahalanobis: with covariance L L^T, ||d inv(L)^T|| is the Mahalanobis length of d
+    try:
+        cholesky = np.linalg.cholesky(np.cov(points, rowvar=False))
+    except np.linalg.LinAlgError:
+        # Degenerate covariance; standardizing is the closest sensible metric
+        return axis_transform(points, 'standardized')
+    return np.linalg.inv(cholesky).T
+
+
+class LookupEngine:
+    """Interface shared by every lookup backend"""
+
+    name = None
+
+    def __init__(self, data: Optional[pd.DataFrame] = None, metric: Optional[str] = None,
+                 weights: Optional[Tuple[float, float]] = None):
+        self.metric = metric or DEFAULT_METRIC
+        self.weights = weights or DEFAULT_AXIS_WEIGHTS
+        self.transform = None
+        self.points = np.empty((0, 2))
+        self.corresponding = np.empty(0)
+        if data is not None:
+            self.load(data)
+
+    def load(self, data: pd.DataFrame) -> 'LookupEngine':
+        """Take the lookup columns of a validated table and build the index"""
+        # A compact float32 table stays float32; arithmetic against queries widens to float64
+        points = float_array(data[QUERY_COLUMNS].to_numpy())
+        corresponding = float_array(data['Corresponding Density'].to_numpy())
+
+        # Rows with a missing coordinate can never be the closest match;
+        # positions are used from here on, so the DataFrame index does not matter
+        valid = ~np.isnan(points).any(axis=1)
+
+        # Points are kept only in the metric's scaled space, so queries never rescale the table
+        self.transform = axis_transform(points[valid], self.metric, self.weights)
+        self.points = self.scale_points(points[valid]).astype(points.dtype, copy=False)
+        self.corresponding = corresponding[valid]
+        self.build_index()
+        return self
+
+    @classmethod
+    def from_scaled(cls, points: np.ndarray, corresponding: np.ndarray, transform: Optional[np.ndarray] = None,
+                    metric: Optional[str] = None, weights: Optional[Tuple[float, float]] = None) -> 'LookupEngine':
+        """Rebuild an engine from another engine's scaled arrays, e.g. in a worker process"""
+        engine = cls(metric=metric, weights=weights)
+        engine.transform = transform
+        engine.points = points
+        engine.corresponding = corresponding
+        engine.build_index()
+        return engine
+
+    def scale_points(self, points: np.ndarray) -> np.ndarray:
+        """Map raw (density, temperature) pairs into the scaled space"""
+        if self.transform is None:
+            return points
+        # Written out rather than a matmul, whose rounding can depend on the number of rows;
+        # a query must scale identically whether it is resolved alone or in a batch
+        return points[:, [0]] * self.transform[0] + points[:, [1]] * self.transform[1]
+
+    def build_index(self):
+        """Prepare any search structure; called once per load"""
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the engine's arrays and index"""
+        return self.points.nbytes + self.corresponding.nbytes
+
+    def query_points(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Corresponding density and match distance for an (M, 2) array of scaled queries"""
+        raise NotImplementedError
+
+    def interpolate_points(self, points: np.ndarray) -> np.ndarray:
+        """Interpolated Corresponding Density per scaled query; NaN where the engine cannot interpolate"""
+        return np.full(len(points), np.nan)
+
+    def query(self, measured_density: float, observed_temp: float) -> Optional[Tuple[float, float]]:
+        """Resolve a single query pair"""
+        if not len(self):
+            return None
+        point = self.scale_points(np.array([[measured_density, observed_temp]], dtype=float))
+        corresponding, distances = self.query_points(point)
+        return float(corresponding[0]), float(distances[0])
+
+    def interpolate(self, measured_density: float, observed_temp: float) -> Optional[float]:
+        """Interpolated Corresponding Density for a single query pair, if available"""
+        if not len(self):
+            return None
+        point = self.scale_points(np.array([[measured_density, observed_temp]], dtype=float))
+        value = self.interpolate_points(point)[0]
+        return None if np.isnan(value) else float(value)
+
+    def map_chunks(self, method, measured_density: np.ndarray, observed_temp: np.ndarray,
+                   outputs: int, chunk_size: int = BATCH_CHUNK_SIZE) -> Tuple[np.ndarray, ...]:
+        """Apply a per-points method to many query pairs; rows with a missing value get NaN"""
+        queries = np.column_stack([
+            np.asarray(measured_density, dtype=float),
+            np.asarray(observed_temp, dtype=float)
+        ])
+        results = tuple(np.full(len(queries), np.nan) for _ in range(outputs))
+        if not len(self):
+            return results
+
+        # Resolve the queries in fixed-size chunks to bound temporary memory
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            valid = ~np.isnan(chunk).any(axis=1)
+            rows = np.arange(start, start + len(chunk))[valid]
+            chunk_results = method(self.scale_points(chunk[valid]))
+            if outputs == 1:
+                chunk_results = (chunk_results,)
+            for result, chunk_result in zip(results, chunk_results):
+                result[rows] = chunk_result
+
+        return results
+
+    def query_batch(self, measured_density: np.ndarray, observed_temp: np.ndarray,
+                    chunk_size: int = BATCH_CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """Resolve many query pairs at once; rows with a missing value get NaN"""
+        return self.map_chunks(self.query_points, measured_density, observed_temp, 2, chunk_size)
+
+    def interpolate_batch(self, measured_density: np.ndarray, observed_temp: np.ndarray,
+                          chunk_size: int = BATCH_CHUNK_SIZE) -> np.ndarray:
+        """Interpolate many query pairs at once; NaN where unavailable"""
+        return self.map_chunks(self.interpolate_points, measured_density, observed_temp, 1, chunk_size)[0]
+
+
+ENGINES = {}
+
+
+def register_engine(cls):
+    """Class decorator that makes an engine available by name"""
+    ENGINES[cls.name] = cls
+    return cls
+
+
+def create_engine(data: pd.DataFrame, name: Optional[str] = None, metric: Optional[str] = None,
+                  weights: Optional[Tuple[float, float]] = None) -> LookupEngine:
+    """Build the named engine (DEFAULT_ENGINE if omitted) over a table"""
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown lookup engine '{name}'. Available engines: {', '.join(sorted(ENGINES))}")
+    return ENGINES[name](data, metric=metric, weights=weights)
+
+
+@register_engine
+class BruteForceEngine(LookupEngine):
+    """Scan every row; no build cost, O(N) per query"""
+
+    name = 'brute'
+
+    def query_points(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        corresponding = np.empty(len(points))
+        distances = np.empty(len(points))
+
+        # Bound the (queries x rows) distance matrix held in memory at once
+        block = max(1, BRUTE_FORCE_BLOCK // len(self))
+        for start in range(0, len(points), block):
+            chunk = points[start:start + block]
+            squared = (
+                (self.points[:, 0] - chunk[:, [0]])**2 +
+                (self.points[:, 1] - chunk[:, [1]])**2
+            )
+            nearest = squared.argmin(axis=1)
+            corresponding[start:start + block] = self.corresponding[nearest]
+            distances[start:start + block] = np.sqrt(squared[np.arange(len(chunk)), nearest])
+
+        return corresponding, distances
+
+
+class RegularGrid:
+    """Dense 2-D array of a table whose rows sit on a rectilinear grid
+
+    Lookups resolve by index arithmetic in O(1). Nodes missing from a
+    near-complete grid are flagged so callers can fall back to a search.
+    """
+
+    def __init__(self, origin, step, shape):
+        self.origin = np.asarray(origin, dtype=float)
+        self.step = np.asarray(step, dtype=float)
+        self.shape = shape
+        self.values = np.full(shape, np.nan)
+        self.present = np.zeros(shape, dtype=bool)
+        # Exact node coordinates, so distances match the rows they came from
+        self.axes = [self.origin[k] + self.step[k] * np.arange(shape[k]) for k in range(2)]
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.present.all())
+
+    @classmethod
+    def detect(cls, points: np.ndarray, values: np.ndarray,
+               min_coverage: float = GRID_MIN_COVERAGE) -> Optional['RegularGrid']:
+        """Build a grid if the points form a complete or near-complete one"""
+        # Coordinates stored as float32 can sit this far from their exact node
+        resolution = 4 * np.finfo(points.dtype).eps * np.abs(points).max(axis=0)
+        points = np.asarray(points, dtype=float)
+
+        origin, step, shape, positions = [], [], [], []
+        for k in range(2):
+            axis = np.unique(points[:, k])
+            if len(axis) < 2:
+                return None
+
+            gaps = np.diff(axis)
+            size = int(np.rint((axis[-1] - axis[0]) / gaps.min())) + 1
+            if size > len(points) / min_coverage:
+                return None
+            # The step over the whole axis is more accurate than any single gap
+            axis_step = (axis[-1] - axis[0]) / (size - 1)
+            tolerance = max(GRID_TOLERANCE * axis_step, resolution[k])
+
+            # Gaps left by missing nodes must be whole multiples of the step
+            if not np.allclose(gaps / axis_step, np.rint(gaps / axis_step), atol=tolerance / axis_step):
+                return None
+            position = np.rint((points[:, k] - axis[0]) / axis_step).astype(np.int64)
+            if np.abs(points[:, k] - (axis[0] + position * axis_step)).max() > tolerance:
+                return None
+
+            origin.append(axis[0])
+            step.append(axis_step)
+            shape.append(size)
+            positions.append(position)
+
+        if len(points) < min_coverage * shape[0] * shape[1]:
+            return None
+
+        # The first row at each node wins, as it does for a scan of the table
+        flat = positions[0] * shape[1] + positions[1]
+        nodes, first = np.unique(flat, return_index=True)
+        if len(nodes) < min_coverage * shape[0] * shape[1]:
+            return None
+
+        grid = cls(origin, step, tuple(shape))
+        grid.values.flat[nodes] = values[first]
+        grid.present.flat[nodes] = True
+        for k in range(2):
+            grid.axes[k][positions[k][first]] = points[first, k]
+        return grid
+
+    def fractional_position(self, points: np.ndarray) -> np.ndarray:
+        return (points - self.origin) / self.step
+
+    def nearest(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Nearest node per query: value, distance and whether the node is present"""
+        position = np.rint(self.fractional_position(points))
+        i = np.clip(position[:, 0], 0, self.shape[0] - 1).astype(np.int64)
+        j = np.clip(position[:, 1], 0, self.shape[1] - 1).astype(np.int64)
+        distances = np.sqrt(
+            (points[:, 0] - self.axes[0][i])**2 +
+            (points[:, 1] - self.axes[1][j])**2
+        )
+        return self.values[i, j], distances, self.present[i, j]
+
+    def bilinear(self, points: np.ndarray) -> np.ndarray:
+        """Bilinear interpolation between the four surrounding nodes; NaN outside the grid"""
+        position = self.fractional_position(points)
+        inside = (
+            (position[:, 0] >= 0) & (position[:, 0] <= self.shape[0] - 1) &
+            (position[:, 1] >= 0) & (position[:, 1] <= self.shape[1] - 1)
+        )
+        i = np.clip(np.floor(position[:, 0]), 0, self.shape[0] - 2).astype(np.int64)
+        j = np.clip(np.floor(position[:, 1]), 0, self.shape[1] - 2).astype(np.int64)
+        tx = position[:, 0] - i
+        ty = position[:, 1] - j
+
+        result = (
+            (1 - tx) * (1 - ty) * self.values[i, j] +
+            tx * (1 - ty) * self.values[i + 1, j] +
+            (1 - tx) * ty * self.values[i, j + 1] +
+            tx * ty * self.values[i + 1, j + 1]
+        )
+        return np.where(inside, result, np.nan)
+
+
+@register_engine
+class IndexedEngine(LookupEngine):
+    """Index arithmetic for regular grids, otherwise a KD-tree; O(log N) per query at worst"""
+
+    name = 'indexed'
+
+    def build_index(self):
+        self.grid = RegularGrid.detect(self.points, self.corresponding) if len(self) else None
+        # A complete grid answers every query itself
+        needs_tree = len(self) and (self.grid is None or not self.grid.complete)
+        self.tree = cKDTree(self.points) if needs_tree else None
+
+    def nbytes(self) -> int:
+        total = super().nbytes()
+        if self.grid is not None:
+            total += self.grid.values.nbytes + self.grid.present.nbytes
+        if self.tree is not None:
+            total += self.tree.data.nbytes + self.tree.indices.nbytes
+        return total
+
+    def query_points(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.grid is None:
+            distances, nearest = self.tree.query(points)
+            return self.corresponding[nearest], distances
+
+        corresponding, distances, present = self.grid.nearest(points)
+        # Queries whose nearest node is missing from the table search the rows instead
+        missing = ~present
+        if missing.any():
+            missing_distances, nearest = self.tree.query(points[missing])
+            corresponding[missing] = self.corresponding[nearest]
+            distances[missing] = missing_distances
+        return corresponding, distances
+
+    def interpolate_points(self, points: np.ndarray) -> np.ndarray:
+        """Bilinear interpolation on a detected grid"""
+        if self.grid is None:
+            return super().interpolate_points(points)
+        return self.grid.bilinear(points)
+
+
+@register_engine
+class InterpolatingEngine(IndexedEngine):
+    """Inverse-distance weighted blend of the nearest rows
+
+    The reported distance is still the distance to the nearest row.
+    """
+
+    name = 'interpolating'
+
+    def build_index(self):
+        super().build_index()
+        if self.tree is None and len(self):
+            self.tree = cKDTree(self.points)
+
+    def query_points(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(INTERPOLATION_NEIGHBOURS, len(self))
+        distances, nearest = self.tree.query(points, k=k)
+        distances = distances.reshape(len(points), k)
+        nearest = nearest.reshape(len(points), k)
+
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances
+        # An exact hit takes the row's value unchanged
+        exact = np.isinf(weights).any(axis=1)
+        weights[exact] = np.where(np.isinf(weights[exact]), 1.0, 0.0)
+
+        values = self.corresponding[nearest]
+        corresponding = (weights * values).sum(axis=1) / weights.sum(axis=1)
+        return corresponding, distances[:, 0]
+
+
+@register_engine
+class TriangulatedEngine(IndexedEngine):
+    """Barycentric interpolation over a Delaunay triangulation of the table
+
+    Lookups still return the nearest row; interpolate() and
+    interpolate_batch() give the interpolated Corresponding Density inside
+    the convex hull of the table and NaN outside it.
+    """
+
+    name = 'triangulated'
+
+    def build_index(self):
+        super().build_index()
+        self.triangulation = None
+        if len(self) < 3:
+            return
+
+        # Triangulate in span-normalized coordinates so that, whatever the
+        # metric, the wide temperature axis does not produce long, thin triangles
+        span = np.ptp(self.points, axis=0)
+        self.span = np.where(span > 0, span, 1.0)
+        try:
+            self.triangulation = Delaunay(self.points / self.span)
+        except QhullError:
+            # All points on one line; there is nothing to interpolate over
+            self.triangulation = None
+
+    def nbytes(self) -> int:
+        total = super().nbytes()
+        if self.triangulation is not None:
+            total += sum(array.nbytes for array in (
+                self.triangulation.points, self.triangulation.simplices,
+                self.triangulation.neighbors, self.triangulation.transform
+            ))
+        return total
+
+    def interpolate_points(self, points: np.ndarray) -> np.ndarray:
+        result = np.full(len(points), np.nan)
+        if self.triangulation is None:
+            return result
+
+        scaled = points / self.span
+        simplex = self.triangulation.find_simplex(scaled)
+        inside = simplex >= 0
+        transform = self.triangulation.transform[simplex[inside]]
+        barycentric = np.einsum('ijk,ik->ij', transform[:, :2], scaled[inside] - transform[:, 2])
+        weights = np.column_stack([barycentric, 1 - barycentric.sum(axis=1)])
+
+        vertices = self.triangulation.simplices[simplex[inside]]
+        result[inside] = (self.corresponding[vertices] * weights).sum(axis=1)
+        return result
+
+
+class SurrogateModel:
+    """Least-squares polynomial surface Corresponding Density = f(Measured Density, Observed Temperature)
+
+    Only the coefficients are kept, so evaluation is O(1) per query and the
+    table can be released after fitting. Residual statistics from the fit
+    say how far the surface can be trusted.
+    """
+
+    def __init__(self, degree: int = SURROGATE_DEGREE):
+        self.degree = degree
+        # Exponent pairs (i, j) of every term x**i * y**j with i + j <= degree
+        self.powers = [(i, total - i) for total in range(degree + 1) for i in range(total, -1, -1)]
+        self.center = np.zeros(2)
+        self.half_span = np.ones(2)
+        self.coefficients = np.full(len(self.powers), np.nan)
+        self.rows = 0
+        self.rms_residual = np.nan
+        self.max_residual = np.nan
+        self.r_squared = np.nan
+
+    def design_matrix(self, points: np.ndarray) -> np.ndarray:
+        # Map the table onto [-1, 1] per axis so the normal equations stay well conditioned
+        x, y = ((points - self.center) / self.half_span).T
+        return np.column_stack([x**i * y**j for i, j in self.powers])
+
+    @classmethod
+    def fit(cls, data: pd.DataFrame, degree: int = SURROGATE_DEGREE,
+            chunk_size: int = BATCH_CHUNK_SIZE) -> 'SurrogateModel':
+        """Fit the surface to a validated table, reading it in chunks"""
+        model = cls(degree)
+        points = data[QUERY_COLUMNS].to_numpy(dtype=float)
+        values = data['Corresponding Density'].to_numpy(dtype=float)
+        valid = ~(np.isnan(points).any(axis=1) | np.isnan(values))
+        points, values = points[valid], values[valid]
+        model.rows = len(points)
+        if not model.rows:
+            return model
+
+        low, high = points.min(axis=0), points.max(axis=0)
+        model.center = (low + high) / 2
+        model.half_span = np.where(high > low, (high - low) / 2, 1.0)
+
+        # Accumulate the normal equations chunk by chunk instead of holding an N x terms matrix
+        gram = np.zeros((len(model.powers), len(model.powers)))
+        moment = np.zeros(len(model.powers))
+        for start in range(0, model.rows, chunk_size):
+            design = model.design_matrix(points[start:start + chunk_size])
+            gram += design.T @ design
+            moment += design.T @ values[start:start + chunk_size]
+        # lstsq tolerates the rank deficiency of tables with too few distinct points
+        model.coefficients = np.linalg.lstsq(gram, moment, rcond=None)[0]
+
+        squared, largest = 0.0, 0.0
+        for start in range(0, model.rows, chunk_size):
+            residuals = values[start:start + chunk_size] - model.evaluate(points[start:start + chunk_size])
+            squared += float(residuals @ residuals)
+            largest = max(largest, float(np.abs(residuals).max()))
+        total = float(((values - values.mean())**2).sum())
+        model.rms_residual = float(np.sqrt(squared / model.rows))
+        model.max_residual = largest
+        model.r_squared = 1 - squared / total if total > 0 else 1.0
+        return model
+
+    def evaluate(self, points: np.ndarray) -> np.ndarray:
+        """Surface value for an (M, 2) array of raw query pairs"""
+        return self.design_matrix(points) @ self.coefficients
+
+    def predict(self, measured_density: float, observed_temp: float) -> Optional[float]:
+        """Surface value for a single query pair; None before a successful fit"""
+        if not self.rows:
+            return None
+        return float(self.evaluate(np.array([[measured_density, observed_temp]], dtype=float))[0])
+
+    def stats(self) -> dict:
+        return {
+            'degree': self.degree,
+            'rows': self.rows,
+            'rms_residual': self.rms_residual,
+            'max_residual': self.max_residual,
+            'r_squared': self.r_squared
+        }
+
+
+@register_engine
+class ModelEngine(LookupEngine):
+    """Answer every query from a fitted SurrogateModel instead of the table
+
+    No rows are kept, so there is no matched row and the reported distance
+    is NaN; the model's residual statistics take its place.
+    """
+
+    name = 'model'
+
+    def load(self, data: pd.DataFrame) -> 'LookupEngine':
+        # The surface is fitted on raw values; distance metrics do not apply
+        self.transform = None
+        self.model = SurrogateModel.fit(data)
+        return self
+
+    def __len__(self) -> int:
+        return self.model.rows
+
+    def nbytes(self) -> int:
+        return self.model.coefficients.nbytes
+
+    def query_points(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self.model.evaluate(points), np.full(len(points), np.nan)
+
+
+def fit_surrogate(data: pd.DataFrame, engine: Optional[LookupEngine] = None) -> SurrogateModel:
+    """Surrogate model of a table, reusing the engine's fit when it already is one"""
+    if isinstance(engine, ModelEngine):
+        return engine.model
+    return SurrogateModel.fit(data)
+
+
+def find_closest_match(data: pd.DataFrame, measured_density: float, observed_temp: float,
+                       engine: Optional[LookupEngine] = None) -> Optional[Tuple[float, float]]:
+    """Find the closest match based on Euclidean distance (or the engine's metric)"""
+    if data is None or data.empty:
+        return None
+
+    # Without a prebuilt engine, fall back to scanning the table
+    if engine is None:
+        engine = BruteForceEngine(data)
+    return engine.query(measured_density, observed_temp)
+
+
+class LookupCache:
+    """LRU cache of lookup results keyed on dataset fingerprint and quantized inputs"""
+
+    def __init__(self, maxsize: int = LOOKUP_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, engine: LookupEngine, fingerprint, measured_density: float,
+               observed_temp: float) -> Optional[Tuple[float, float]]:
+        """Resolve a query through the cache
+
+        Only inputs already on the quantization grid, such as values from the
+        "%.4f"/"%.2f" number inputs, are cached. Anything finer, e.g. typed
+        free text, is looked up exactly as given and never served another
+        query's answer.
+        """
+        rounded_density = round(float(measured_density), DENSITY_DECIMALS)
+        rounded_temp = round(float(observed_temp), TEMPERATURE_DECIMALS)
+        # Tolerates the float noise of widget arithmetic, e.g. 0.8500000000000001
+        if not (math.isclose(measured_density, rounded_density, rel_tol=1e-9, abs_tol=1e-12)
+                and math.isclose(observed_temp, rounded_temp, rel_tol=1e-9, abs_tol=1e-12)):
+            return engine.query(measured_density, observed_temp)
+        measured_density, observed_temp = rounded_density, rounded_temp
+        key = (fingerprint, measured_density, observed_temp)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        result = engine.query(measured_density, observed_temp)
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = result
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return result
+
+    def invalidate(self, fingerprint=None):
+        """Drop the results of one dataset, or of every dataset"""
+        with self.lock:
+            if fingerprint is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0] == fingerprint]:
+                    del self.entries[key]
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def batch_lookup(engine: LookupEngine, queries: pd.DataFrame,
+                 chunk_size: int = BATCH_CHUNK_SIZE) -> pd.DataFrame:
+    """Resolve every (Measured Density, Observed Temperature) row of a query table"""
+    measured_density, observed_temp = query_arrays(queries)
+    corresponding, distances = engine.query_batch(measured_density, observed_temp, chunk_size=chunk_size)
+    interpolated = engine.interpolate_batch(measured_density, observed_temp, chunk_size=chunk_size)
+    return batch_results(queries, corresponding, distances, interpolated)
+
+
+def query_arrays(queries: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Numeric query columns of a table; unparseable values become NaN"""
+    measured_density = pd.to_numeric(queries['Measured Density'], errors='coerce').to_numpy(dtype=float)
+    observed_temp = pd.to_numeric(queries['Observed Temperature'], errors='coerce').to_numpy(dtype=float)
+    return measured_density, observed_temp
+
+
+def batch_results(queries: pd.DataFrame, corresponding: np.ndarray, distances: np.ndarray,
+                  interpolated: np.ndarray) -> pd.DataFrame:
+    """Copy of the query table with the lookup results appended"""
+    results = queries.copy()
+    results['Corresponding Density'] = corresponding
+    results['Match Distance'] = distances
+
+    # Engines that can interpolate add their answer alongside the nearest row
+    if not np.isnan(interpolated).all():
+        results['Interpolated Density'] = interpolated
+    return results
@@ -1,8 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pandas as pd
-import numpy as np
+import queue
+import threading
 from typing import Optional, Tuple
+from density_lookup import LookupCache, create_engine, find_closest_match, fit_surrogate, validate_data_structure
+from data_loading import file_content_hash, load_reference_table
+
+PREVIEW_ROWS = 10  # Rows rendered in the data preview at any time
+LOAD_POLL_MS = 100  # How often the main loop checks on a background load
+
+class LoadCancelled(Exception):
+    """Raised inside the loading worker when the user cancels"""
+
+def file_display_name(file_path):
+    """File name without its directory, for either path separator"""
+    return file_path.split('/')[-1] if '/' in file_path else file_path.split('\\')[-1]
 
 class DensityTemperatureApp:
     def __init__(self, root):
@@ -14,6 +26,18 @@ class DensityTemperatureApp:
         # Data storage
         self.data = None
         self.file_path = None
+        self.engine = None
+        self.model = None
+        self.data_hash = None
+        self.lookup_cache = LookupCache()
+        
+        # Background loading
+        self.load_queue = None
+        self.cancel_event = None
+        
+        # Data preview window
+        self.preview_columns = []
+        self.preview_top = 0
         
         # Create the main interface
         self.create_widgets()
@@ -71,6 +95,20 @@ class DensityTemperatureApp:
         )
         self.file_path_label.pack(side='left', padx=(20, 0))
         
+        # Cancel button and progress bar, shown only while a file is loading
+        self.cancel_btn = tk.Button(
+            upload_frame,
+            text="Cancel",
+            command=self.cancel_loading,
+            bg='#e74c3c',
+            fg='white',
+            font=("Arial", 10),
+            padx=10,
+            relief='flat',
+            cursor='hand2'
+        )
+        self.progress_bar = ttk.Progressbar(upload_frame, length=150, maximum=100)
+        
     def create_input_section(self):
         # Input frame
         input_frame = tk.Frame(self.root, bg='#f0f0f0')
@@ -169,14 +207,26 @@ class DensityTemperatureApp:
             font=("Arial", 12, "bold")
         ).pack(anchor='w')
         
-        # Treeview for data display
-        self.tree = ttk.Treeview(display_frame, height=10)
+        # Treeview for data display; only the visible window of rows is ever inserted
+        self.tree = ttk.Treeview(display_frame, height=PREVIEW_ROWS)
         self.tree.pack(fill='both', expand=True, pady=5)
+        self.tree.bind('<MouseWheel>', self.on_preview_mousewheel)
+        self.tree.bind('<Button-4>', self.on_preview_mousewheel)
+        self.tree.bind('<Button-5>', self.on_preview_mousewheel)
         
-        # Scrollbar for treeview
-        scrollbar = ttk.Scrollbar(display_frame, orient='vertical', command=self.tree.yview)
-        scrollbar.pack(side='right', fill='y')
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Scrollbar drives the preview window instead of the treeview itself
+        self.preview_scrollbar = ttk.Scrollbar(display_frame, orient='vertical', command=self.scroll_preview)
+        self.preview_scrollbar.pack(side='right', fill='y')
+        
+        # Visible row range
+        self.preview_label = tk.Label(
+            display_frame,
+            text="",
+            bg='#f0f0f0',
+            fg='#7f8c8d',
+            font=("Arial", 10)
+        )
+        self.preview_label.pack(anchor='w')
         
     def upload_file(self):
         """Upload and load Excel file"""
@@ -186,46 +236,136 @@ class DensityTemperatureApp:
         )
         
         if file_path:
-            try:
-                # Load Excel file
-                self.data = pd.read_excel(file_path)
-                self.file_path = file_path
-                
-                # Update file path label
-                filename = file_path.split('/')[-1] if '/' in file_path else file_path.split('\\')[-1]
-                self.file_path_label.config(text=f"Loaded: {filename}")
-                
-                # Validate data structure
-                if self.validate_data_structure():
-                    self.display_data()
-                    messagebox.showinfo("Success", "File loaded successfully!")
+            self.start_loading(file_path)
+    
+    def start_loading(self, file_path):
+        """Load, validate and index a file on a worker thread"""
+        # Only the most recent load is ever applied
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        
+        self.cancel_event = threading.Event()
+        self.load_queue = queue.Queue()
+        worker = threading.Thread(
+            target=self.load_worker,
+            args=(file_path, self.cancel_event, self.load_queue),
+            daemon=True
+        )
+        
+        filename = file_display_name(file_path)
+        self.file_path_label.config(text=f"Loading: {filename}...")
+        self.progress_bar.config(mode='indeterminate', value=0)
+        self.progress_bar.pack(side='right')
+        self.progress_bar.start()
+        self.cancel_btn.pack(side='right', padx=(10, 10))
+        
+        worker.start()
+        self.root.after(LOAD_POLL_MS, self.poll_loading, self.load_queue)
+    
+    def load_worker(self, file_path, cancel_event, results):
+        """Runs off the main thread and reports back only through the results queue"""
+        def report_progress(rows_read, total_rows):
+            if cancel_event.is_set():
+                raise LoadCancelled()
+            results.put(('progress', rows_read, total_rows))
+        
+        try:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            content_hash = file_content_hash(content)
+            data = load_reference_table(content, content_hash, progress=report_progress)
+            
+            if cancel_event.is_set():
+                raise LoadCancelled()
+            if not validate_data_structure(data):
+                results.put(('invalid',))
+                return
+            
+            engine = create_engine(data)
+            model = fit_surrogate(data, engine)
+            if cancel_event.is_set():
+                raise LoadCancelled()
+            results.put(('done', file_path, data, engine, model, content_hash))
+        except LoadCancelled:
+            results.put(('cancelled',))
+        except Exception as e:
+            results.put(('error', e))
+    
+    def poll_loading(self, results):
+        """Apply messages from the loading worker on the main thread"""
+        if results is not self.load_queue:
+            return
+        
+        try:
+            while True:
+                message = results.get_nowait()
+                if message[0] == 'progress':
+                    _, rows_read, total_rows = message
+                    if total_rows:
+                        self.progress_bar.stop()
+                        self.progress_bar.config(mode='determinate', value=100 * min(rows_read / total_rows, 1.0))
                 else:
-                    messagebox.showerror("Error", 
-                        "Invalid data structure. Please ensure your Excel file has columns:\n"
-                        "'Measured Density', 'Observed Temperature', 'Corresponding Density'")
-                    self.data = None
-                    self.file_path = None
-                    self.file_path_label.config(text="No file selected")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load file: {str(e)}")
-                self.data = None
-                self.file_path = None
-                self.file_path_label.config(text="No file selected")
+                    self.finish_loading(message)
+                    return
+        except queue.Empty:
+            pass
+        
+        self.root.after(LOAD_POLL_MS, self.poll_loading, results)
     
-    def validate_data_structure(self):
-        """Validate that the data has the required columns"""
-        if self.data is None:
-            return False
+    def finish_loading(self, message):
+        """Swap in the new table, or keep the previous one if loading failed"""
+        self.load_queue = None
+        self.cancel_event = None
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        self.cancel_btn.pack_forget()
+        
+        if message[0] == 'done':
+            _, file_path, data, engine, model, content_hash = message
+            self.data = data
+            self.engine = engine
+            self.model = model
+            self.data_hash = content_hash
+            self.lookup_cache.invalidate()
+            self.file_path = file_path
+            
+            # Update file path label
+            filename = file_display_name(file_path)
+            self.file_path_label.config(text=f"Loaded: {filename}")
             
-        required_columns = ['Measured Density', 'Observed Temperature', 'Corresponding Density']
-        return all(col in self.data.columns for col in required_columns)
+            self.display_data()
+            messagebox.showinfo("Success",
+                "File loaded successfully!\n\n"
+                f"Surrogate model (degree {model.degree}): RMS residual {model.rms_residual:.4f}, "
+                f"max residual {model.max_residual:.4f}, R² {model.r_squared:.4f}")
+            return
+        
+        self.restore_file_path_label()
+        if message[0] == 'invalid':
+            messagebox.showerror("Error", 
+                "Invalid data structure. Please ensure your Excel file has columns:\n"
+                "'Measured Density', 'Observed Temperature', 'Corresponding Density'")
+        elif message[0] == 'error':
+            messagebox.showerror("Error", f"Failed to load file: {str(message[1])}")
+    
+    def cancel_loading(self):
+        """Stop the current background load"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.file_path_label.config(text="Cancelling...")
+    
+    def restore_file_path_label(self):
+        """Show the file that is currently loaded"""
+        if self.file_path:
+            filename = file_display_name(self.file_path)
+            self.file_path_label.config(text=f"Loaded: {filename}")
+        else:
+            self.file_path_label.config(text="No file selected")
     
     def display_data(self):
         """Display the loaded data in the treeview"""
-        # Clear existing data
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.preview_columns = []
+        self.preview_top = 0
         
         if self.data is not None:
             # Set up columns
@@ -238,10 +378,61 @@ class DensityTemperatureApp:
                 self.tree.heading(col, text=col)
                 self.tree.column(col, width=150, anchor='center')
             
-            # Insert data
-            for index, row in self.data.iterrows():
-                values = [str(row[col]) for col in columns]
+            # Rows are read from the column arrays as they scroll into view
+            self.preview_columns = [self.data[col].to_numpy() for col in columns]
+        
+        self.render_preview()
+    
+    def preview_row_count(self):
+        """Number of rows available to the preview"""
+        return len(self.preview_columns[0]) if self.preview_columns else 0
+    
+    def render_preview(self):
+        """Render the visible window of rows into the treeview"""
+        total_rows = self.preview_row_count()
+        start = self.preview_top
+        end = min(start + PREVIEW_ROWS, total_rows)
+        items = self.tree.get_children()
+        
+        # Reuse the existing items and only add or remove the difference
+        for offset, row in enumerate(range(start, end)):
+            values = [str(column[row]) for column in self.preview_columns]
+            if offset < len(items):
+                self.tree.item(items[offset], values=values)
+            else:
                 self.tree.insert('', 'end', values=values)
+        for item in items[end - start:]:
+            self.tree.delete(item)
+        
+        if total_rows:
+            self.preview_scrollbar.set(start / total_rows, end / total_rows)
+            self.preview_label.config(text=f"Showing rows {start + 1}-{end} of {total_rows}")
+        else:
+            self.preview_scrollbar.set(0, 1)
+            self.preview_label.config(text="")
+    
+    def scroll_preview(self, action, amount, unit=None):
+        """Move the preview window in response to the scrollbar"""
+        total_rows = self.preview_row_count()
+        if action == 'moveto':
+            top = int(float(amount) * total_rows)
+        elif unit == 'pages':
+            top = self.preview_top + int(amount) * PREVIEW_ROWS
+        else:
+            top = self.preview_top + int(amount)
+        
+        top = max(0, min(top, total_rows - PREVIEW_ROWS))
+        if top != self.preview_top:
+            self.preview_top = top
+            self.render_preview()
+    
+    def on_preview_mousewheel(self, event):
+        """Scroll the preview window with the mouse wheel"""
+        if event.num == 4 or event.delta > 0:
+            self.scroll_preview('scroll', -1, 'units')
+        else:
+            self.scroll_preview('scroll', 1, 'units')
+        return 'break'
     
     def find_corresponding_density(self):
         """Find corresponding density based on measured density and observed temperature"""
@@ -259,10 +450,22 @@ class DensityTemperatureApp:
             
             if result is not None:
                 corresponding_density, distance = result
-                self.result_label.config(
-                    text=f"Corresponding Density: {corresponding_density:.4f} (Distance: {distance:.4f})",
-                    fg='#27ae60'
-                )
+                if self.engine is not None and self.engine.name == 'model':
+                    text = f"Corresponding Density: {corresponding_density:.4f} (fitted model)"
+                else:
+                    text = f"Corresponding Density: {corresponding_density:.4f} (Distance: {distance:.4f})"
+                
+                # Engines that can interpolate also give an interpolated answer
+                interpolated = self.engine.interpolate(measured_density, observed_temp) if self.engine else None
+                if interpolated is not None:
+                    text += f"\nInterpolated Density: {interpolated:.4f}"
+                
+                # The fitted surface answers alongside the nearest match, unless it is the engine itself
+                if self.model is not None and self.engine.name != 'model':
+                    model_density = self.model.predict(measured_density, observed_temp)
+                    text += f"\nModel Density: {model_density:.4f} (RMS residual {self.model.rms_residual:.4f})"
+                
+                self.result_label.config(text=text, fg='#27ae60')
             else:
                 self.result_label.config(
                     text="No matching data found for the given inputs",
@@ -276,22 +479,10 @@ class DensityTemperatureApp:
     
     def find_closest_match(self, measured_density: float, observed_temp: float) -> Optional[Tuple[float, float]]:
         """Find the closest match based on Euclidean distance"""
-        if self.data is None:
-            return None
-        
-        # Calculate distances
-        distances = np.sqrt(
-            (self.data['Measured Density'] - measured_density)**2 + 
-            (self.data['Observed Temperature'] - observed_temp)**2
-        )
-        
-        # Find minimum distance
-        min_idx = distances.idxmin()
-        min_distance = distances.iloc[min_idx]
-        
-        # Return corresponding density and distance
-        corresponding_density = self.data.loc[min_idx, 'Corresponding Density']
-        return corresponding_density, min_distance
+        if self.engine is not None:
+            # Repeat lookups of the same inputs are answered from the cache
+            return self.lookup_cache.lookup(self.engine, self.data_hash, measured_density, observed_temp)
+        return find_closest_match(self.data, measured_density, observed_temp)
 
 def main():
     root = tk.Tk()
@@ -28,6 +28,8 @@ def main():
         print("   1. Web App (Basic): python -m streamlit run web_app.py")
         print("   2. Secure Web App: python run_secure_app.py")
         print("   3. Desktop App: python density_temperature_app.py")
+        print("   4. Batch Lookups: python lookup_cli.py reference.xlsx readings.csv")
+        print("   5. Lookup Service: python lookup_service.py reference.xlsx")
         print("\nSee README.md for detailed instructions")
     else:
         print("\nInstallation failed. Please check the error messages above.")
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Streaming command-line batch lookups for the Density-Temperature Lookup Application
+
+Loads a reference table once, then streams query rows from a CSV file,
+standard input or a Parquet file through a generator pipeline in fixed-size
+chunks: read a chunk, resolve it with the table's lookup engine, write it
+out, drop it. Memory stays constant however many rows pass through, so
+nightly reconciliations of hundreds of millions of readings can run from
+cron without Streamlit or Tk.
+
+Query rows need 'Measured Density' and 'Observed Temperature' columns; any
+other columns are passed through unchanged. Query values that are missing
+or do not parse as numbers come out blank, along with their results. CSV
+input is read as UTF-8, with or without the byte-order mark that Excel's
+"CSV UTF-8" export writes.
+
+Usage:
+    python lookup_cli.py sample_data.xlsx readings.csv > results.csv
+    cat readings.csv | python lookup_cli.py sample_data.xlsx - --output results.parquet
+    python lookup_cli.py sample_data.xlsx readings.parquet --output results.csv --workers 4
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from typing import Iterable, Iterator, Optional, TextIO
+
+import pandas as pd
+
+from data_loading import file_content_hash, load_reference_table
+from dataset_registry import DatasetHandle, dataset_registry
+from density_lookup import (
+    BATCH_CHUNK_SIZE, QUERY_COLUMNS, LookupEngine, batch_results, query_arrays, validate_data_structure
+)
+from parallel_lookup import ParallelBatchExecutor
+
+DEFAULT_CHUNK_ROWS = BATCH_CHUNK_SIZE  # Query rows read, resolved and written at a time
+
+
+class PipelineError(Exception):
+    """Raised for input the pipeline cannot process, with a message for the user"""
+
+
+def load_reference(path: str) -> DatasetHandle:
+    """Load a reference workbook and its lookup engine, reusing cached snapshots and engines"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    content_hash = file_content_hash(content)
+    data = load_reference_table(content, content_hash)
+    if not validate_data_structure(data):
+        raise PipelineError(f"{path} is missing one of the required columns")
+    return dataset_registry.acquire(content_hash, data)
+
+
+def read_csv_chunks(stream: TextIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Chunks of a CSV stream; columns other than the query columns are kept as text
+
+    Keeping pass-through columns as text writes them back exactly as read
+    and gives every chunk the same column types. The header is read first so
+    the query columns can still be parsed as numbers by the fast C parser.
+    """
+    header = next(csv.reader([stream.readline()]), None)
+    if not header:
+        return
+    missing = [col for col in QUERY_COLUMNS if col not in header]
+    if missing:
+        raise PipelineError(f"Query input is missing column(s): {', '.join(missing)}")
+
+    dtypes = {col: str for col in header if col not in QUERY_COLUMNS}
+    yield from pd.read_csv(stream, names=header, header=None, dtype=dtypes, chunksize=chunk_rows)
+
+
+def read_parquet_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Chunks of a Parquet file, read one record batch at a time"""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    missing = [col for col in QUERY_COLUMNS if col not in parquet_file.schema_arrow.names]
+    if missing:
+        raise PipelineError(f"Query input is missing column(s): {', '.join(missing)}")
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def read_chunks(source: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Query chunks from a file, or from standard input when source is '-'"""
+    if source == '-':
+        yield from read_csv_chunks(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline=''), chunk_rows)
+    elif source.lower().endswith('.parquet'):
+        yield from read_parquet_chunks(source, chunk_rows)
+    else:
+        with open(source, encoding='utf-8-sig', newline='') as f:
+            yield from read_csv_chunks(f, chunk_rows)
+
+
+def resolve_chunks(engine: LookupEngine, chunks: Iterable[pd.DataFrame],
+                   executor: Optional[ParallelBatchExecutor] = None) -> Iterator[pd.DataFrame]:
+    """Each query chunk with the lookup results appended, in input order"""
+    for chunk in chunks:
+        measured_density, observed_temp = query_arrays(chunk)
+        if executor is not None:
+            corresponding, distances, interpolated = executor.query_batch(measured_density, observed_temp)
+        else:
+            corresponding, distances = engine.query_batch(measured_density, observed_temp)
+            interpolated = engine.interpolate_batch(measured_density, observed_temp)
+
+        results = batch_results(chunk, corresponding, distances, interpolated)
+        # Every chunk needs the same columns and types, even where no row could be
+        # interpolated or a query value did not parse
+        results['Measured Density'], results['Observed Temperature'] = measured_density, observed_temp
+        results['Interpolated Density'] = interpolated
+        yield results
+
+
+def write_csv(chunks: Iterable[pd.DataFrame], destination: str) -> int:
+    """Write result chunks as one CSV file, or to standard output when destination is '-'
+
+    Uses pyarrow's CSV writer when it is installed, which formats numbers
+    several times faster than pandas; text columns are then quoted.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return write_csv_pandas(chunks, destination)
+
+    rows = 0
+    writer = schema = None
+    sink = sys.stdout.buffer if destination == '-' else destination
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # Later chunks are cast to the first chunk's schema
+                schema = table.schema
+                writer = pa_csv.CSVWriter(sink, schema)
+            writer.write_table(table.cast(schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_csv_pandas(chunks: Iterable[pd.DataFrame], destination: str) -> int:
+    """write_csv() without pyarrow; files are written as UTF-8, like pyarrow's"""
+    rows = 0
+    output = sys.stdout if destination == '-' else open(destination, 'w', encoding='utf-8', newline='')
+    try:
+        for chunk in chunks:
+            chunk.to_csv(output, header=rows == 0, index=False)
+            rows += len(chunk)
+        output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return rows
+
+
+def write_parquet(chunks: Iterable[pd.DataFrame], destination: str) -> int:
+    """Write result chunks as row groups of one Parquet file, or to standard output when destination is '-'"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = schema = None
+    sink = sys.stdout.buffer if destination == '-' else destination
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # Later chunks are cast to the first chunk's schema
+                schema = table.schema
+                writer = pq.ParquetWriter(sink, schema)
+            writer.write_table(table.cast(schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve a stream of density readings against a reference table")
+    parser.add_argument('reference', help="Reference workbook (.xlsx/.xls)")
+    parser.add_argument('queries', nargs='?', default='-',
+                        help="Query rows as CSV or .parquet; '-' reads CSV from standard input (default)")
+    parser.add_argument('--output', default='-',
+                        help="Results file (.csv or .parquet); '-' writes to standard output (default)")
+    parser.add_argument('--format', choices=['csv', 'parquet'],
+                        help="Output format; by default taken from the output file's extension, else CSV")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Query rows processed at a time (default: {DEFAULT_CHUNK_ROWS:,})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Resolve each chunk across this many worker processes (default: 1, in-process)")
+    parser.add_argument('--quiet', action='store_true', help="Do not print a summary to standard error")
+    args = parser.parse_args()
+    if args.chunk_rows < 1:
+        parser.error("--chunk-rows must be at least 1")
+
+    output_format = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'csv')
+    write = write_parquet if output_format == 'parquet' else write_csv
+    start = time.perf_counter()
+    executor = None
+
+    try:
+        handle = load_reference(args.reference)
+        if args.workers > 1 and len(handle.engine.points):
+            # Each chunk is split evenly across the pool, which lives for the whole run
+            executor = ParallelBatchExecutor(handle.engine, args.workers, -(-args.chunk_rows // args.workers))
+
+        chunks = resolve_chunks(handle.engine, read_chunks(args.queries, args.chunk_rows), executor)
+        rows = write(chunks, args.output)
+    except BrokenPipeError:
+        # The reader went away, e.g. piped into head; silence the final flush of stdout
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except (PipelineError, OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if executor is not None:
+            executor.close()
+
+    if not args.quiet:
+        seconds = time.perf_counter() - start
+        print(f"✅ Resolved {rows:,} rows in {seconds:.1f}s ({rows / seconds:,.0f} rows/s) "
+              f"with {type(handle.engine).__name__}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
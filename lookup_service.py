@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Headless HTTP/JSON lookup service for the Density-Temperature Lookup Application
+
+Reference tables are loaded once at start-up and stay resident with their
+lookup engine built, so PLCs and other internal tools can resolve readings
+without the Streamlit UI. Requests are handled on an asyncio event loop;
+queries against the same table that arrive within a few milliseconds of
+each other are coalesced into one vectorized batch, resolved off the loop
+by the same engine find_closest_match() uses, and answered individually.
+
+Everything runs from the standard library plus the app's own modules, with
+no network access beyond the listening socket.
+
+Usage:
+    python lookup_service.py sample_data.xlsx
+    python lookup_service.py plant_a.xlsx plant_b.xlsx --port 8600
+
+Endpoints:
+    GET  /health   -> {"status": "ok", "tables": [...]}
+    GET  /tables   -> rows, engine and metric per loaded table
+    GET  /stats    -> request and micro-batch counters
+    POST /lookup   <- {"measured_density": 0.85, "observed_temperature": 20, "table": "sample_data"}
+                   <- {"queries": [[0.85, 20], [0.86, 25]], "table": "sample_data"}
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data_loading import file_content_hash, load_reference_table
+from dataset_registry import DatasetHandle, dataset_registry
+from density_lookup import LookupEngine, validate_data_structure
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8600
+BATCH_WINDOW_SECONDS = 0.002  # How long the first query of a batch waits for others to join it
+BATCH_MAX_ROWS = 10_000  # Query rows resolved per micro-batch
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_QUERIES_PER_REQUEST = 100_000
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    """A request the service cannot answer, with the HTTP status to report"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def resolve(engine: LookupEngine, queries: np.ndarray) -> np.ndarray:
+    """Corresponding density, match distance and interpolated density for (n, 2) queries"""
+    measured_density, observed_temp = queries[:, 0], queries[:, 1]
+    corresponding, distances = engine.query_batch(measured_density, observed_temp)
+    interpolated = engine.interpolate_batch(measured_density, observed_temp)
+    return np.column_stack([corresponding, distances, interpolated])
+
+
+class MicroBatcher:
+    """Coalesces concurrent queries against one engine into vectorized batches
+
+    Callers await submit(); a single task per table drains the queue, waits
+    up to the batch window for more queries, and resolves the whole batch in
+    a worker thread so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, engine: LookupEngine, window: float = BATCH_WINDOW_SECONDS,
+                 max_rows: int = BATCH_MAX_ROWS):
+        self.engine = engine
+        self.window = window
+        self.max_rows = max_rows
+        self.queue = None
+        self.task = None
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, queries: np.ndarray) -> np.ndarray:
+        """Results for (n, 2) queries, resolved together with whatever else is pending"""
+        if self.task is None:
+            # Created lazily so they belong to the running loop
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((queries, future))
+        return await future
+
+    async def collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """The next batch: the first pending request, plus any that arrive within the window"""
+        batch = [await self.queue.get()]
+        rows = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.window
+        while rows < self.max_rows:
+            remaining = deadline - asyncio.get_running_loop().time()
+            try:
+                item = self.queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(self.queue.get(), remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.collect()
+            queries = np.concatenate([item[0] for item in batch])
+            try:
+                results = await asyncio.to_thread(resolve, self.engine, queries)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(queries)
+            start = 0
+            for item_queries, future in batch:
+                stop = start + len(item_queries)
+                # A caller that disconnected may have cancelled its future
+                if not future.done():
+                    future.set_result(results[start:stop])
+                start = stop
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'mean_batch_rows': self.rows / self.batches if self.batches else 0.0
+        }
+
+
+class LookupService:
+    """Resident reference tables and the JSON API over them"""
+
+    def __init__(self):
+        self.tables: Dict[str, DatasetHandle] = {}
+        self.batchers: Dict[str, MicroBatcher] = {}
+        self.requests = 0
+        self.started = time.time()
+
+    def load_table(self, path: str, name: Optional[str] = None) -> str:
+        """Load a reference workbook and build its engine; returns the table's name"""
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        if name in self.tables:
+            raise ValueError(f"Two tables are named '{name}'; give the files different names")
+        with open(path, 'rb') as f:
+            content = f.read()
+        content_hash = file_content_hash(content)
+        data = load_reference_table(content, content_hash)
+        if not validate_data_structure(data):
+            raise ValueError(f"{path} is missing one of the required columns")
+
+        handle = dataset_registry.acquire(content_hash, data)
+        self.tables[name] = handle
+        self.batchers[name] = MicroBatcher(handle.engine)
+        return name
+
+    def close(self):
+        for handle in self.tables.values():
+            handle.release()
+        self.tables.clear()
+        self.batchers.clear()
+
+    def table_for(self, name: Optional[str]) -> str:
+        """Name of the table a request refers to; optional when only one is loaded"""
+        if name is None:
+            if len(self.tables) != 1:
+                raise RequestError(400, f"Specify 'table', one of: {', '.join(sorted(self.tables))}")
+            return next(iter(self.tables))
+        if name not in self.tables:
+            raise RequestError(404, f"Unknown table '{name}'")
+        return name
+
+    async def lookup(self, request: dict) -> dict:
+        """Resolve a single query or a list of queries from a /lookup request"""
+        if not isinstance(request, dict):
+            raise RequestError(400, "Request body must be a JSON object")
+        name = self.table_for(request.get('table'))
+
+        if 'queries' in request:
+            queries = parse_queries(request['queries'])
+            results = await self.batchers[name].submit(queries)
+            return {'table': name, 'results': [result_record(row) for row in results]}
+
+        queries = parse_queries([[request.get('measured_density'), request.get('observed_temperature')]])
+        results = await self.batchers[name].submit(queries)
+        return dict(table=name, **result_record(results[0]))
+
+    def describe_tables(self) -> dict:
+        return {
+            name: {
+                'rows': len(handle.data),
+                'engine': type(handle.engine).__name__,
+                'metric': handle.engine.metric,
+                'dataset': handle.dataset.content_hash[:12]
+            }
+            for name, handle in self.tables.items()
+        }
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'uptime_seconds': time.time() - self.started,
+            'batching': {name: batcher.stats() for name, batcher in self.batchers.items()}
+        }
+
+    async def route(self, method: str, path: str, body: bytes) -> dict:
+        """Response document for a request; raises RequestError for anything else"""
+        self.requests += 1
+        if path == '/lookup':
+            if method != 'POST':
+                raise RequestError(405, "Use POST for /lookup")
+            try:
+                request = json.loads(body)
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise RequestError(400, "Request body is not valid JSON")
+            return await self.lookup(request)
+
+        if method != 'GET':
+            raise RequestError(405, f"Use GET for {path}")
+        if path == '/health':
+            return {'status': 'ok', 'tables': sorted(self.tables)}
+        if path == '/tables':
+            return self.describe_tables()
+        if path == '/stats':
+            return self.stats()
+        raise RequestError(404, f"No endpoint at {path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one connection until either side closes it"""
+        try:
+            while True:
+                try:
+                    method, path, headers, body = await read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except RequestError as e:
+                    await write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+
+                try:
+                    status, document = 200, await self.route(method, path, body)
+                except RequestError as e:
+                    status, document = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, document = 500, {'error': f"Lookup failed: {e}"}
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await write_response(writer, status, document, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def parse_queries(queries) -> np.ndarray:
+    """(n, 2) float array from a list of [density, temperature] pairs or query objects"""
+    if not isinstance(queries, list) or not queries:
+        raise RequestError(400, "'queries' must be a non-empty list")
+    if len(queries) > MAX_QUERIES_PER_REQUEST:
+        raise RequestError(413, f"At most {MAX_QUERIES_PER_REQUEST} queries per request")
+
+    pairs = []
+    for query in queries:
+        if isinstance(query, dict):
+            query = [query.get('measured_density'), query.get('observed_temperature')]
+        if not isinstance(query, (list, tuple)) or len(query) != 2:
+            raise RequestError(400, "Each query needs a measured density and an observed temperature")
+        pairs.append(query)
+    try:
+        array = np.array(pairs, dtype=float)
+    except (TypeError, ValueError):
+        raise RequestError(400, "Measured density and observed temperature must be numbers")
+    if not np.isfinite(array).all():
+        raise RequestError(400, "Measured density and observed temperature must be finite numbers")
+    return array
+
+
+def json_number(value: float) -> Optional[float]:
+    """A float for JSON, with NaN (no answer) as null"""
+    return None if math.isnan(value) else float(value)
+
+
+def result_record(row: np.ndarray) -> dict:
+    return {
+        'corresponding_density': json_number(row[0]),
+        'match_distance': json_number(row[1]),
+        'interpolated_density': json_number(row[2])
+    }
+
+
+async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, dict, bytes]:
+    """Method, path, lower-cased headers and body of the next request on a connection"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise RequestError(413, "Request headers are too large")
+
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split()
+    if len(parts) != 3:
+        raise RequestError(400, "Malformed request line")
+    method, target, _ = parts
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name:
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target.split('?', 1)[0], headers, body
+
+
+async def write_response(writer: asyncio.StreamWriter, status: int, document: dict, keep_alive: bool = True):
+    body = json.dumps(document).encode()
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+class LookupClient:
+    """Minimal blocking client for the service, for scripts and local testing"""
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method: str, path: str, document: Optional[dict] = None) -> dict:
+        body = json.dumps(document) if document is not None else None
+        self.connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f"{response.status}: {result.get('error')}")
+        return result
+
+    def lookup(self, measured_density: float, observed_temp: float, table: Optional[str] = None) -> dict:
+        request = {'measured_density': measured_density, 'observed_temperature': observed_temp}
+        if table is not None:
+            request['table'] = table
+        return self.request('POST', '/lookup', request)
+
+    def lookup_many(self, queries: Sequence[Sequence[float]], table: Optional[str] = None) -> List[dict]:
+        request = {'queries': [list(map(float, query)) for query in queries]}
+        if table is not None:
+            request['table'] = table
+        return self.request('POST', '/lookup', request)['results']
+
+    def close(self):
+        self.connection.close()
+
+
+async def serve(service: LookupService, host: str, port: int):
+    server = await asyncio.start_server(service.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve density lookups over HTTP/JSON")
+    parser.add_argument('tables', nargs='+', help="Reference workbooks to keep loaded; each is named after its file")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    args = parser.parse_args()
+
+    service = LookupService()
+    for path in args.tables:
+        try:
+            name = service.load_table(path)
+        except (OSError, ValueError) as e:
+            service.close()
+            parser.error(str(e))
+        handle = service.tables[name]
+        print(f"✅ Loaded '{name}': {len(handle.data):,} rows ({type(handle.engine).__name__})")
+
+    print(f"🚀 Serving lookups on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n🛑 Service stopped")
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
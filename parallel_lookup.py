@@ -0,0 +1,163 @@
+"""
+Parallel batch lookups for the Density-Temperature Lookup Application
+
+Very large query sets are split into row ranges and resolved by a pool of
+worker processes. The engine's reference arrays, the queries and the results
+all live in shared memory, so only array names and row offsets are pickled.
+Each worker rebuilds the same engine class over the same scaled arrays, so
+results are identical to resolving the queries in-process.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from density_lookup import LookupEngine, batch_lookup, batch_results, query_arrays
+
+PARALLEL_WORKERS = int(os.environ.get('DENSITY_PARALLEL_WORKERS', 0))  # 0 uses every CPU
+PARALLEL_MIN_ROWS = 1_000_000  # Smaller batches are resolved in-process
+PARALLEL_CHUNK_ROWS = 500_000  # Query rows per task handed to a worker
+
+# Per-process state of a pool worker, set by init_worker
+worker_state = {}
+
+
+def create_shared(array: np.ndarray) -> Tuple[SharedMemory, tuple]:
+    """Copy an array into a new shared memory block; returns the block and its spec"""
+    shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach_shared(spec: tuple) -> Tuple[SharedMemory, np.ndarray]:
+    """Map a block created by create_shared into this process"""
+    name, shape, dtype = spec
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def release_shared(shm: SharedMemory, unlink: bool = False):
+    shm.close()
+    if unlink:
+        shm.unlink()
+
+
+def init_worker(engine_class, points_spec: tuple, corresponding_spec: tuple,
+                transform: Optional[np.ndarray], metric: str, weights: Tuple[float, float]):
+    """Attach the reference arrays and build this worker's engine once"""
+    points_shm, points = attach_shared(points_spec)
+    corresponding_shm, corresponding = attach_shared(corresponding_spec)
+    # The blocks stay mapped for the worker's lifetime
+    worker_state['segments'] = (points_shm, corresponding_shm)
+    worker_state['engine'] = engine_class.from_scaled(points, corresponding, transform, metric, weights)
+
+
+def resolve_range(query_spec: tuple, result_spec: tuple, start: int, stop: int) -> int:
+    """Resolve query rows [start, stop) into the shared result block"""
+    engine = worker_state['engine']
+    query_shm, queries = attach_shared(query_spec)
+    result_shm, results = attach_shared(result_spec)
+    try:
+        measured_density, observed_temp = queries[0, start:stop], queries[1, start:stop]
+        results[0, start:stop], results[1, start:stop] = engine.query_batch(measured_density, observed_temp)
+        results[2, start:stop] = engine.interpolate_batch(measured_density, observed_temp)
+    finally:
+        # Views must go before the mappings can be closed
+        del queries, results
+        release_shared(query_shm)
+        release_shared(result_shm)
+    return stop - start
+
+
+class ParallelBatchExecutor:
+    """Pool of worker processes sharing one engine's reference arrays
+
+    Engines that keep no rows, such as the fitted model, cannot be rebuilt
+    from shared arrays and are rejected; parallel_batch_lookup() resolves
+    them in-process instead.
+
+    Workers are started with 'spawn', which is safe inside the threaded
+    Streamlit server and works the same on every platform.
+    """
+
+    def __init__(self, engine: LookupEngine, workers: Optional[int] = None,
+                 chunk_rows: int = PARALLEL_CHUNK_ROWS):
+        if not len(engine.points):
+            raise ValueError(f"{type(engine).__name__} keeps no rows to share with worker processes")
+        self.engine = engine
+        self.workers = workers or PARALLEL_WORKERS or os.cpu_count() or 1
+        self.chunk_rows = chunk_rows
+
+        # Arrays keep their dtype, so workers see exactly the values the engine was built from
+        points_shm, points_spec = create_shared(np.ascontiguousarray(engine.points))
+        corresponding_shm, corresponding_spec = create_shared(np.ascontiguousarray(engine.corresponding))
+        self.segments = [points_shm, corresponding_shm]
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context('spawn'),
+            initializer=init_worker,
+            initargs=(type(engine), points_spec, corresponding_spec, engine.transform, engine.metric, engine.weights)
+        )
+
+    def query_batch(self, measured_density: np.ndarray,
+                    observed_temp: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Corresponding density, match distance and interpolated density per query, in input order"""
+        queries = np.vstack([
+            np.asarray(measured_density, dtype=float),
+            np.asarray(observed_temp, dtype=float)
+        ])
+        n_queries = queries.shape[1]
+        query_shm, query_spec = create_shared(queries)
+        result_shm, result_spec = create_shared(np.full((3, n_queries), np.nan))
+        try:
+            futures = [
+                self.pool.submit(resolve_range, query_spec, result_spec, start, min(start + self.chunk_rows, n_queries))
+                for start in range(0, n_queries, self.chunk_rows)
+            ]
+            for future in futures:
+                future.result()
+
+            # Copy the results out so the shared block can be released
+            results = np.ndarray((3, n_queries), dtype=float, buffer=result_shm.buf)
+            corresponding, distances, interpolated = (results[k].copy() for k in range(3))
+            del results
+        finally:
+            release_shared(query_shm, unlink=True)
+            release_shared(result_shm, unlink=True)
+        return corresponding, distances, interpolated
+
+    def close(self):
+        """Stop the workers and free the shared reference arrays"""
+        self.pool.shutdown()
+        for shm in self.segments:
+            release_shared(shm, unlink=True)
+        self.segments = []
+
+    def __enter__(self) -> 'ParallelBatchExecutor':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parallel_batch_lookup(engine: LookupEngine, queries: pd.DataFrame, workers: Optional[int] = None,
+                          min_rows: int = PARALLEL_MIN_ROWS) -> pd.DataFrame:
+    """batch_lookup() spread over worker processes when the query table is large enough
+
+    Small batches, single-worker configurations and engines that keep no
+    rows (the fitted model) are resolved in-process, where a pool would only
+    add start-up cost.
+    """
+    workers = workers or PARALLEL_WORKERS or os.cpu_count() or 1
+    if len(queries) < min_rows or workers < 2 or not len(engine.points):
+        return batch_lookup(engine, queries)
+
+    measured_density, observed_temp = query_arrays(queries)
+    with ParallelBatchExecutor(engine, workers) as executor:
+        corresponding, distances, interpolated = executor.query_batch(measured_density, observed_temp)
+    return batch_results(queries, corresponding, distances, interpolated)
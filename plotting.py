@@ -0,0 +1,188 @@
+"""
+Plotting helpers for the Density-Temperature Lookup Application
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Tables larger than this are aggregated server-side instead of sent point by point
+LARGE_PLOT_ROWS = int(os.environ.get('DENSITY_LARGE_PLOT_ROWS', 20_000))
+PLOT_GRID_BINS = 150  # Bins per axis of the aggregated Corresponding Density grid
+PLOT_SAMPLE_POINTS = 5_000  # Points drawn with WebGL on top of the aggregated grid
+BASE_FIGURE_CACHE_SIZE = 8  # Datasets whose base figure is kept in memory
+
+
+def aggregate_density_grid(data: pd.DataFrame, bins: int = PLOT_GRID_BINS):
+    """Mean Corresponding Density on a regular 2-D grid of the input space"""
+    x = data['Measured Density'].to_numpy(dtype=float)
+    y = data['Observed Temperature'].to_numpy(dtype=float)
+    z = data['Corresponding Density'].to_numpy(dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y) | np.isnan(z))
+    x, y, z = x[valid], y[valid], z[valid]
+
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    sums, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges], weights=z)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    # Heatmap rows run along y, so the histogram is transposed
+    return x_centers, y_centers, means.T
+
+
+def sample_points(data: pd.DataFrame, max_points: int = PLOT_SAMPLE_POINTS) -> pd.DataFrame:
+    """Deterministic subsample so the chart does not change between reruns"""
+    if len(data) <= max_points:
+        return data
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(len(data), size=max_points, replace=False))
+    return data.iloc[rows]
+
+
+def create_large_scatter_plot(data: pd.DataFrame) -> go.Figure:
+    """Aggregated heatmap plus a WebGL sample, with a payload independent of table size"""
+    x_centers, y_centers, means = aggregate_density_grid(data)
+    sample = sample_points(data)
+
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=x_centers,
+        y=y_centers,
+        z=means,
+        colorscale='Viridis',
+        colorbar=dict(title='Corresponding Density'),
+        name='Mean Corresponding Density',
+        hovertemplate='Measured Density: %{x:.4f}<br>Observed Temperature: %{y:.2f}<br>'
+                      'Mean Corresponding Density: %{z:.4f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scattergl(
+        x=sample['Measured Density'],
+        y=sample['Observed Temperature'],
+        mode='markers',
+        marker=dict(
+            color=sample['Corresponding Density'],
+            colorscale='Viridis',
+            size=3,
+            opacity=0.5
+        ),
+        name=f'Sample ({len(sample):,} of {len(data):,} rows)',
+        customdata=sample['Corresponding Density'],
+        hovertemplate='Measured Density: %{x}<br>Observed Temperature: %{y}<br>'
+                      'Corresponding Density: %{customdata}<extra></extra>'
+    ))
+    fig.update_layout(
+        title='Density-Temperature Data Visualization',
+        xaxis_title='Measured Density',
+        yaxis_title='Observed Temperature'
+    )
+    return fig
+
+
+def add_input_marker(fig: go.Figure, measured_density: float, observed_temp: float) -> go.Figure:
+    """Add the "Your Input" marker, or move it if the figure already has one"""
+    hovertemplate = f'Your Input<br>Measured Density: {measured_density}<br>Observed Temperature: {observed_temp}<extra></extra>'
+    for trace in fig.data:
+        if trace.name == 'Your Input':
+            trace.update(x=[measured_density], y=[observed_temp], hovertemplate=hovertemplate)
+            return fig
+
+    fig.add_trace(go.Scatter(
+        x=[measured_density],
+        y=[observed_temp],
+        mode='markers',
+        marker=dict(
+            color='red',
+            size=15,
+            symbol='x',
+            line=dict(width=3, color='darkred')
+        ),
+        name='Your Input',
+        hovertemplate=hovertemplate
+    ))
+    return fig
+
+
+def create_scatter_plot(data: pd.DataFrame, measured_density: float = None, observed_temp: float = None,
+                        large_data_rows: int = LARGE_PLOT_ROWS):
+    """Create an interactive scatter plot"""
+    if len(data) > large_data_rows:
+        fig = create_large_scatter_plot(data)
+    else:
+        fig = px.scatter(
+            data,
+            x='Measured Density',
+            y='Observed Temperature',
+            color='Corresponding Density',
+            size='Corresponding Density',
+            hover_data=['Corresponding Density'],
+            title='Density-Temperature Data Visualization',
+            color_continuous_scale='Viridis'
+        )
+
+    # Add user input point if provided
+    if measured_density is not None and observed_temp is not None:
+        add_input_marker(fig, measured_density, observed_temp)
+
+    fig.update_layout(
+        width=800,
+        height=600,
+        showlegend=True
+    )
+
+    return fig
+
+
+def figure_nbytes(fig: go.Figure) -> int:
+    """Approximate memory held by a figure's data arrays"""
+    total = 0
+    for trace in fig.data:
+        for name in ('x', 'y', 'z', 'customdata'):
+            values = getattr(trace, name, None)
+            if values is not None:
+                total += np.asarray(values).nbytes
+        marker = getattr(trace, 'marker', None)
+        for name in ('color', 'size'):
+            values = getattr(marker, name, None) if marker is not None else None
+            if values is not None and not isinstance(values, str):
+                total += np.asarray(values).nbytes
+    return total
+
+
+class FigureCache:
+    """LRU cache of base figures keyed by dataset content hash"""
+
+    def __init__(self, max_entries: int = BASE_FIGURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, data: pd.DataFrame, data_hash: str) -> go.Figure:
+        """Base figure for a dataset, built on first use; callers must not modify it"""
+        with self.lock:
+            fig = self.entries.get(data_hash)
+            if fig is not None:
+                self.entries.move_to_end(data_hash)
+                return fig
+
+        fig = create_scatter_plot(data)
+        with self.lock:
+            self.entries[data_hash] = fig
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return fig
+
+
+# Shared by every session and rerun in this process
+figure_cache = FigureCache()
+
+
+def session_figure(data: pd.DataFrame, data_hash: str) -> go.Figure:
+    """Private copy of the cached base figure that a session can overlay its input on"""
+    return go.Figure(figure_cache.get(data, data_hash))
@@ -0,0 +1,126 @@
+"""
+Opt-in rerun profiling for the Density-Temperature Lookup Application
+
+Set DENSITY_PROFILING=1 to time each phase of a Streamlit rerun. Set
+DENSITY_PROFILE_SLOW_SECONDS as well to write a cProfile dump of every
+rerun that takes longer than that many seconds. The unauthenticated web
+app only shows the timings panel when DENSITY_PROFILING_PANEL=1 is set too.
+"""
+
+import cProfile
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+PROFILING_ENABLED = os.environ.get('DENSITY_PROFILING', '') == '1'
+PROFILING_PANEL = os.environ.get('DENSITY_PROFILING_PANEL', '') == '1'  # Operator-only switch for web_app.py
+SLOW_RERUN_SECONDS = float(os.environ.get('DENSITY_PROFILE_SLOW_SECONDS', 0))  # 0 disables cProfile dumps
+PROFILE_DIR = os.environ.get('DENSITY_PROFILE_DIR', 'profiles')
+ROLLING_WINDOW = 500  # Timings kept per phase
+HISTOGRAM_BUCKETS = [0, 0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, np.inf]  # Seconds
+
+
+class PhaseStats:
+    """Rolling window of timings per phase, shared by every session in this process"""
+
+    def __init__(self, window: int = ROLLING_WINDOW):
+        self.window = window
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def record(self, phase: str, seconds: float):
+        with self.lock:
+            self.timings.setdefault(phase, deque(maxlen=self.window)).append(seconds)
+
+    def phases(self):
+        with self.lock:
+            return list(self.timings)
+
+    def summary(self) -> pd.DataFrame:
+        """Count and percentiles per phase, in milliseconds"""
+        rows = []
+        with self.lock:
+            for phase, timings in self.timings.items():
+                values = np.array(timings) * 1000
+                rows.append({
+                    'Phase': phase,
+                    'Count': len(values),
+                    'p50 (ms)': np.percentile(values, 50),
+                    'p95 (ms)': np.percentile(values, 95),
+                    'Max (ms)': values.max()
+                })
+        return pd.DataFrame(rows, columns=['Phase', 'Count', 'p50 (ms)', 'p95 (ms)', 'Max (ms)'])
+
+    def histogram(self, phase: str) -> pd.Series:
+        """Number of timings per duration bucket"""
+        with self.lock:
+            values = np.array(self.timings.get(phase, ()))
+        counts, _ = np.histogram(values, bins=HISTOGRAM_BUCKETS)
+        labels = [
+            f"<{upper * 1000:g} ms" if np.isfinite(upper) else f">={lower * 1000:g} ms"
+            for lower, upper in zip(HISTOGRAM_BUCKETS[:-1], HISTOGRAM_BUCKETS[1:])
+        ]
+        return pd.Series(counts, index=labels, name=phase)
+
+    def clear(self):
+        with self.lock:
+            self.timings.clear()
+
+
+# Shared by every session and rerun in this process
+phase_stats = PhaseStats()
+
+
+class RerunProfiler:
+    """Times the phases of one script rerun; does nothing unless enabled"""
+
+    def __init__(self, enabled: bool = PROFILING_ENABLED, slow_seconds: float = SLOW_RERUN_SECONDS):
+        self.enabled = enabled
+        self.slow_seconds = slow_seconds
+        self.profile = None
+        self.started = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.started = time.perf_counter()
+        if self.slow_seconds:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Another profiler is already active on this thread
+                self.profile = None
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase_stats.record(name, time.perf_counter() - start)
+
+    def finish(self):
+        """Record the whole rerun and dump the profile if it was slow"""
+        if not self.enabled or self.started is None:
+            return
+        total = time.perf_counter() - self.started
+        phase_stats.record('total', total)
+
+        if self.profile is not None:
+            # Cleared first, so a failed dump cannot leave a profiler behind
+            profile, self.profile = self.profile, None
+            profile.disable()
+            if total > self.slow_seconds:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                filename = f"rerun-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+                profile.dump_stats(os.path.join(PROFILE_DIR, filename))
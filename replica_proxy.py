@@ -0,0 +1,337 @@
+"""
+Sticky-session reverse proxy for running several app replicas
+
+Each browser is pinned to one replica by a cookie, so its Streamlit session,
+which lives in that replica's memory, survives page loads and WebSocket
+reconnects. Every request on a keep-alive connection is routed on its own
+cookie; a connection only becomes a plain byte pipe once a WebSocket upgrade
+has been accepted. Replicas that fail their health check are given no new
+browsers.
+
+A new browser opens several connections before it has a cookie, so requests
+without one are routed by client address for a short while after the first
+assignment. That keeps one browser on one replica without tying a whole
+network to it for good.
+"""
+
+import http.client
+import socket
+import socketserver
+import threading
+import time
+from http.cookies import CookieError, SimpleCookie
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+STICKY_COOKIE = 'density_replica'
+HEALTH_PATH = '/_stcore/health'  # Streamlit's built-in health endpoint
+HEALTH_TIMEOUT_SECONDS = 2
+ASSIGNMENT_SECONDS = 60  # How long cookieless requests from one address follow its first assignment
+MAX_HEADER_BYTES = 64 * 1024
+BUFFER_SIZE = 64 * 1024
+
+
+class Replica:
+    """One app process listening on a local port"""
+
+    def __init__(self, index: int, port: int, host: str = '127.0.0.1'):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.healthy = False
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def check_health(self) -> bool:
+        """Ask the replica's health endpoint, and remember the answer"""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=HEALTH_TIMEOUT_SECONDS)
+        try:
+            connection.request('GET', HEALTH_PATH)
+            self.healthy = connection.getresponse().status == 200
+        except (OSError, http.client.HTTPException):
+            self.healthy = False
+        finally:
+            connection.close()
+        return self.healthy
+
+
+class Message:
+    """Start line and headers of one HTTP request or response, kept as received"""
+
+    def __init__(self, lines: List[bytes]):
+        self.lines = lines
+        self.start = lines[0].split(None, 2)
+
+    def header(self, name: bytes) -> List[bytes]:
+        """Values of every header with this lower-case name"""
+        values = []
+        for line in self.lines[1:]:
+            key, _, value = line.partition(b':')
+            if key.strip().lower() == name:
+                values.append(value.strip())
+        return values
+
+    def has_token(self, name: bytes, token: bytes) -> bool:
+        """Whether a comma-separated header such as Connection lists a token"""
+        return any(token in value.lower().replace(b' ', b'').split(b',') for value in self.header(name))
+
+    def add_header(self, line: str):
+        self.lines.append(line.encode('latin-1'))
+
+    def encode(self) -> bytes:
+        return b''.join(line + b'\r\n' for line in self.lines) + b'\r\n'
+
+    @property
+    def version(self) -> bytes:
+        # Requests end with the version, responses start with it
+        return self.start[0] if self.start[0].startswith(b'HTTP/') else self.start[-1]
+
+    def keep_alive(self) -> bool:
+        if self.has_token(b'connection', b'close'):
+            return False
+        return self.version != b'HTTP/1.0' or self.has_token(b'connection', b'keep-alive')
+
+    def body_length(self) -> Optional[int]:
+        """Content-Length, 0 without one, or None for a chunked body"""
+        if self.has_token(b'transfer-encoding', b'chunked'):
+            return None
+        lengths = self.header(b'content-length')
+        return int(lengths[0]) if lengths else 0
+
+
+def read_message(reader: BinaryIO) -> Optional[Message]:
+    """The next message head on a connection, or None once it is closed"""
+    lines = []
+    size = 0
+    while True:
+        line = reader.readline(MAX_HEADER_BYTES)
+        if not line:
+            return None
+        size += len(line)
+        if size > MAX_HEADER_BYTES:
+            raise ValueError("Message headers are too large")
+        line = line.rstrip(b'\r\n')
+        if not line:
+            if lines:
+                return Message(lines)
+            continue  # Stray blank lines between messages are allowed
+        lines.append(line)
+
+
+def copy_exact(reader: BinaryIO, destination: socket.socket, length: int):
+    while length > 0:
+        chunk = reader.read(min(length, BUFFER_SIZE))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a message")
+        destination.sendall(chunk)
+        length -= len(chunk)
+
+
+def copy_chunked(reader: BinaryIO, destination: socket.socket):
+    """Copy a chunked body, including its trailers, unchanged"""
+    while True:
+        line = reader.readline(MAX_HEADER_BYTES)
+        if not line:
+            raise ConnectionError("Connection closed in the middle of a message")
+        destination.sendall(line)
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            break
+        copy_exact(reader, destination, size + 2)  # The chunk and its CRLF
+    while True:
+        line = reader.readline(MAX_HEADER_BYTES)
+        destination.sendall(line)
+        if line in (b'\r\n', b'\n', b''):
+            break
+
+
+def copy_body(reader: BinaryIO, destination: socket.socket, length: Optional[int]):
+    if length is None:
+        copy_chunked(reader, destination)
+    else:
+        copy_exact(reader, destination, length)
+
+
+def pipe(reader: BinaryIO, destination: socket.socket):
+    """Copy bytes one way until the source closes; used for upgraded connections"""
+    try:
+        while True:
+            # read1 also hands over anything already buffered from the HTTP exchange
+            chunk = reader.read1(BUFFER_SIZE)
+            if not chunk:
+                break
+            destination.sendall(chunk)
+    except OSError:
+        pass
+    finally:
+        # Let the other direction finish on its own
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def sticky_replica_index(request: Message) -> Optional[int]:
+    """Replica index from the request's sticky cookie, if it has one"""
+    for value in request.header(b'cookie'):
+        cookie = SimpleCookie()
+        try:
+            cookie.load(value.decode('latin-1'))
+        except CookieError:
+            continue
+        if STICKY_COOKIE in cookie and cookie[STICKY_COOKIE].value.isdigit():
+            return int(cookie[STICKY_COOKIE].value)
+    return None
+
+
+def error_response(status: str) -> bytes:
+    body = f"{status}\n".encode()
+    return (
+        f"HTTP/1.1 {status}\r\nContent-Type: text/plain\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    ).encode() + body
+
+
+class Upstream:
+    """A keep-alive connection from one client connection to one replica"""
+
+    def __init__(self, replica: Replica):
+        self.replica = replica
+        self.socket = socket.create_connection((replica.host, replica.port))
+        self.reader = self.socket.makefile('rb')
+        with replica.lock:
+            replica.connections += 1
+
+    def stale(self) -> bool:
+        """Whether the replica has closed this idle connection, e.g. after its keep-alive timeout"""
+        # A non-blocking peek works on every platform, unlike MSG_DONTWAIT
+        self.socket.setblocking(False)
+        try:
+            return self.socket.recv(1, socket.MSG_PEEK) == b''
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            self.socket.setblocking(True)
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+        with self.replica.lock:
+            self.replica.connections -= 1
+
+
+class ProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        client = self.request
+        reader = client.makefile('rb')
+        upstreams: Dict[int, Upstream] = {}
+        try:
+            self.serve(client, reader, upstreams)
+        except (OSError, ValueError):
+            pass
+        finally:
+            for upstream in upstreams.values():
+                upstream.close()
+            reader.close()
+
+    def serve(self, client: socket.socket, reader: BinaryIO, upstreams: Dict[int, Upstream]):
+        """Route each request on the connection by its own cookie"""
+        while True:
+            request = read_message(reader)
+            if request is None:
+                return
+
+            replica, assigned = self.server.choose(sticky_replica_index(request), self.client_address[0])
+            if replica is None:
+                client.sendall(error_response("503 Service Unavailable"))
+                return
+
+            upstream = upstreams.get(replica.index)
+            if upstream is not None and upstream.stale():
+                upstreams.pop(replica.index).close()
+                upstream = None
+            if upstream is None:
+                try:
+                    upstream = upstreams[replica.index] = Upstream(replica)
+                except OSError:
+                    replica.healthy = False
+                    client.sendall(error_response("502 Bad Gateway"))
+                    return
+
+            upstream.socket.sendall(request.encode())
+            copy_body(reader, upstream.socket, request.body_length())
+
+            response = read_message(upstream.reader)
+            # Interim responses such as 100 Continue precede the real one
+            while response is not None and response.start[1].startswith(b'1') and response.start[1] != b'101':
+                client.sendall(response.encode())
+                response = read_message(upstream.reader)
+            if response is None:
+                client.sendall(error_response("502 Bad Gateway"))
+                return
+            if assigned:
+                # New browsers are told which replica they now belong to
+                response.add_header(f"Set-Cookie: {STICKY_COOKIE}={replica.index}; Path=/; HttpOnly; SameSite=Lax")
+            client.sendall(response.encode())
+
+            status = int(response.start[1])
+            if status == 101:
+                # WebSocket accepted: from here on the connection belongs to this replica
+                responses = threading.Thread(target=pipe, args=(upstream.reader, client), daemon=True)
+                responses.start()
+                pipe(reader, upstream.socket)
+                responses.join()
+                return
+
+            if request.start[0] == b'HEAD' or status in (204, 304):
+                length = 0
+            elif response.header(b'content-length') or response.has_token(b'transfer-encoding', b'chunked'):
+                length = response.body_length()
+            else:
+                # The body runs until the replica closes the connection
+                pipe(upstream.reader, client)
+                return
+            copy_body(upstream.reader, client, length)
+
+            if not (request.keep_alive() and response.keep_alive()):
+                return
+
+
+class StickyProxy(socketserver.ThreadingTCPServer):
+    """Forward each browser to its own replica, assigning new ones to the least busy"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], replicas: List[Replica]):
+        super().__init__(address, ProxyHandler)
+        self.replicas = replicas
+        # Recent assignments by client address, for requests that have no cookie yet
+        self.assignments: Dict[str, Tuple[int, float]] = {}
+        self.lock = threading.Lock()
+
+    def choose(self, index: Optional[int], client_host: str) -> Tuple[Optional[Replica], bool]:
+        """Replica for a request, and whether the browser must be told about it"""
+        if index is not None and 0 <= index < len(self.replicas) and self.replicas[index].healthy:
+            return self.replicas[index], False
+
+        now = time.monotonic()
+        with self.lock:
+            recent = self.assignments.get(client_host)
+            if recent is not None and now - recent[1] < ASSIGNMENT_SECONDS and self.replicas[recent[0]].healthy:
+                replica = self.replicas[recent[0]]
+            else:
+                healthy = [replica for replica in self.replicas if replica.healthy]
+                if not healthy:
+                    return None, False
+                replica = min(healthy, key=lambda replica: replica.connections)
+            self.assignments[client_host] = (replica.index, now)
+
+            # Forget addresses that have not been seen for a while
+            if len(self.assignments) > 1024:
+                self.assignments = {
+                    host: assignment for host, assignment in self.assignments.items()
+                    if now - assignment[1] < ASSIGNMENT_SECONDS
+                }
+        return replica, True
@@ -3,11 +3,21 @@
 Secure deployment script for the Density-Temperature Lookup Application
 """
 
+import argparse
 import subprocess
 import sys
 import os
+import signal
 import socket
 import getpass
+import threading
+import time
+
+from replica_proxy import Replica, StickyProxy
+
+DEFAULT_PORT = 8501
+REPLICA_BASE_PORT = 8511  # Replicas listen on localhost from this port up; only the proxy is exposed
+HEALTH_INTERVAL_SECONDS = 5
 
 def get_local_ip():
     """Get the local IP address"""
@@ -23,7 +33,7 @@ def get_local_ip():
 
 def check_dependencies():
     """Check if required packages are installed"""
-    required_packages = ['streamlit', 'pandas', 'plotly', 'openpyxl']
+    required_packages = ['streamlit', 'pandas', 'plotly', 'openpyxl', 'scipy']
     missing_packages = []
     
     for package in required_packages:
@@ -73,8 +83,62 @@ level = "error"
             f.write(config_content)
         print("✅ Secure configuration created!")
 
+def start_replica(replica):
+    """Start one app process on the replica's local port"""
+    # Imported here, after check_dependencies() has installed pandas
+    from data_loading import SNAPSHOT_DIR
+
+    env = dict(os.environ)
+    # Every replica reads and writes the same parsed-table and index cache
+    env['DENSITY_SNAPSHOT_DIR'] = os.path.abspath(SNAPSHOT_DIR)
+    return subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", "secure_web_app.py",
+        "--server.address", replica.host,
+        "--server.port", str(replica.port),
+        "--server.headless", "true"
+    ], env=env)
+
+def run_replicas(count, port):
+    """Run several app processes behind a sticky-session proxy, restarting any that die"""
+    replicas = [Replica(index, REPLICA_BASE_PORT + index) for index in range(count)]
+    processes = [start_replica(replica) for replica in replicas]
+
+    # A service manager stops the launcher with SIGTERM; exit through the cleanup below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    proxy = StickyProxy(("0.0.0.0", port), replicas)
+    threading.Thread(target=proxy.serve_forever, name='replica-proxy', daemon=True).start()
+
+    try:
+        while True:
+            for index, replica in enumerate(replicas):
+                if processes[index].poll() is not None:
+                    print(f"⚠️  Replica {index} exited with code {processes[index].returncode}, restarting...")
+                    replica.healthy = False
+                    processes[index] = start_replica(replica)
+                    continue
+                was_healthy = replica.healthy
+                if replica.check_health() != was_healthy:
+                    state = "healthy" if replica.healthy else "unhealthy"
+                    print(f"   Replica {index} (port {replica.port}) is {state}")
+            time.sleep(HEALTH_INTERVAL_SECONDS)
+    finally:
+        proxy.shutdown()
+        proxy.server_close()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
 def main():
     """Main deployment function"""
+    parser = argparse.ArgumentParser(description="Run the secure Density-Temperature Lookup App")
+    parser.add_argument("--replicas", type=int, default=1,
+                        help="number of app processes to run behind a sticky-session proxy (default: 1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"public port (default: {DEFAULT_PORT})")
+    args = parser.parse_args()
+    if args.replicas < 1:
+        parser.error("--replicas must be at least 1")
+
     print("🔒 Secure Density-Temperature Lookup App Deployment")
     print("=" * 50)
     
@@ -91,7 +155,9 @@ def main():
     print(f"\n🌐 Network Information:")
     print(f"   Local IP: {local_ip}")
     print(f"   Username: {username}")
-    print(f"   Port: 8501")
+    print(f"   Port: {args.port}")
+    if args.replicas > 1:
+        print(f"   Replicas: {args.replicas} (ports {REPLICA_BASE_PORT}-{REPLICA_BASE_PORT + args.replicas - 1})")
     
     print(f"\n🔒 Security Features:")
     print(f"   ✅ Password protection enabled")
@@ -101,20 +167,23 @@ def main():
     print(f"   ✅ CORS disabled")
     
     print(f"\n🚀 Starting secure application...")
-    print(f"   Access URL: http://{local_ip}:8501")
-    print(f"   Local URL: http://localhost:8501")
+    print(f"   Access URL: http://{local_ip}:{args.port}")
+    print(f"   Local URL: http://localhost:{args.port}")
     print(f"   Default Password: admin123")
     print(f"\n⚠️  IMPORTANT: Change the default password in secure_web_app.py")
     print(f"   Press Ctrl+C to stop the application")
     print("=" * 50)
     
     try:
-        # Run the secure application
-        subprocess.run([
-            sys.executable, "-m", "streamlit", "run", "secure_web_app.py",
-            "--server.address", "0.0.0.0",
-            "--server.port", "8501"
-        ])
+        if args.replicas > 1:
+            run_replicas(args.replicas, args.port)
+        else:
+            # Run the secure application
+            subprocess.run([
+                sys.executable, "-m", "streamlit", "run", "secure_web_app.py",
+                "--server.address", "0.0.0.0",
+                "--server.port", str(args.port)
+            ])
     except KeyboardInterrupt:
         print("\n🛑 Application stopped by user")
     except Exception as e:
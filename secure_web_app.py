@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from typing import Optional, Tuple
 import io
+from density_lookup import QUERY_COLUMNS, validate_data_structure
+from data_loading import file_content_hash, load_reference_table
+from dataset_registry import dataset_registry
+from parallel_lookup import parallel_batch_lookup
+from plotting import LARGE_PLOT_ROWS, add_input_marker, session_figure
+from profiling import PROFILE_DIR, SLOW_RERUN_SECONDS, RerunProfiler, phase_stats
+from session_reaper import session_reaper
+from work_queue import AdmissionError, work_queue
 import hashlib
 import secrets
 import time
@@ -21,7 +26,13 @@ st.set_page_config(
 # Security configuration
 ADMIN_PASSWORD = "admin123"  # Change this to a strong password
 SESSION_TIMEOUT = 3600  # 1 hour in seconds
+SESSION_IDLE_TIMEOUT = 15 * 60  # Free an inactive session's data after 15 minutes
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
+MAX_HEAVY_JOBS = 2  # Uploads, index builds and batch jobs running at once across all users
+MAX_HEAVY_JOBS_PER_USER = 1  # Heavy jobs one session may have running or queued
+MAX_QUEUED_JOBS = 20  # Heavy jobs allowed to wait before new ones are refused
+
+work_queue.configure(MAX_HEAVY_JOBS, MAX_HEAVY_JOBS_PER_USER, MAX_QUEUED_JOBS)
 
 # Custom CSS for better styling
 st.markdown("""
@@ -81,6 +92,7 @@ def check_authentication():
         if time.time() - st.session_state.login_time > SESSION_TIMEOUT:
             st.session_state.authenticated = False
             st.session_state.login_time = None
+            end_session()
             st.error("Session expired. Please login again.")
             return False
     
@@ -118,71 +130,62 @@ def login_form():
             </div>
             """, unsafe_allow_html=True)
 
-def validate_data_structure(data: pd.DataFrame) -> bool:
-    """Validate that the data has the required columns"""
-    if data is None:
-        return False
-    required_columns = ['Measured Density', 'Observed Temperature', 'Corresponding Density']
-    return all(col in data.columns for col in required_columns)
+def load_batch_queries(uploaded_file) -> pd.DataFrame:
+    """Read a CSV or Excel file of query pairs"""
+    if uploaded_file.name.lower().endswith('.csv'):
+        return pd.read_csv(uploaded_file)
+    return pd.read_excel(uploaded_file)
 
-def find_closest_match(data: pd.DataFrame, measured_density: float, observed_temp: float) -> Optional[Tuple[float, float]]:
-    """Find the closest match based on Euclidean distance"""
-    if data is None or data.empty:
-        return None
-    
-    # Calculate distances
-    distances = np.sqrt(
-        (data['Measured Density'] - measured_density)**2 + 
-        (data['Observed Temperature'] - observed_temp)**2
-    )
-    
-    # Find minimum distance
-    min_idx = distances.idxmin()
-    min_distance = distances.iloc[min_idx]
-    
-    # Return corresponding density and distance
-    corresponding_density = data.loc[min_idx, 'Corresponding Density']
-    return corresponding_density, min_distance
+def session_resources():
+    """This session's heavy objects; the reaper frees them once the session is idle or expired"""
+    if 'session_key' not in st.session_state:
+        st.session_state.session_key = secrets.token_hex(16)
+    login_time = st.session_state.get('login_time')
+    expires_at = login_time + SESSION_TIMEOUT if login_time else None
+    return session_reaper.touch(st.session_state.session_key, SESSION_IDLE_TIMEOUT, expires_at)
 
-def create_scatter_plot(data: pd.DataFrame, measured_density: float = None, observed_temp: float = None):
-    """Create an interactive scatter plot"""
-    fig = px.scatter(
-        data, 
-        x='Measured Density', 
-        y='Observed Temperature',
-        color='Corresponding Density',
-        size='Corresponding Density',
-        hover_data=['Corresponding Density'],
-        title='Density-Temperature Data Visualization',
-        color_continuous_scale='Viridis'
-    )
-    
-    # Add user input point if provided
-    if measured_density is not None and observed_temp is not None:
-        fig.add_trace(go.Scatter(
-            x=[measured_density],
-            y=[observed_temp],
-            mode='markers',
-            marker=dict(
-                color='red',
-                size=15,
-                symbol='x',
-                line=dict(width=3, color='darkred')
-            ),
-            name='Your Input',
-            hovertemplate=f'Your Input<br>Measured Density: {measured_density}<br>Observed Temperature: {observed_temp}<extra></extra>'
-        ))
-    
-    fig.update_layout(
-        width=800,
-        height=600,
-        showlegend=True
-    )
-    
-    return fig
+def end_session():
+    """Free this session's resources as soon as its login ends"""
+    if 'session_key' in st.session_state:
+        session_reaper.remove(st.session_state.session_key)
 
-def main_app():
-    """Main application interface"""
+def show_profiling_panel():
+    """Admin panel with rolling timings of each rerun phase"""
+    with st.sidebar.expander("⏱️ Performance Profile", expanded=False):
+        summary = phase_stats.summary()
+        if summary.empty:
+            st.caption("No timings recorded yet")
+            return
+        st.dataframe(summary.round(2), use_container_width=True, hide_index=True)
+        phase = st.selectbox("Phase histogram", phase_stats.phases(), key="profiling_phase")
+        st.bar_chart(phase_stats.histogram(phase))
+        if SLOW_RERUN_SECONDS:
+            st.caption(f"cProfile dumps of reruns slower than {SLOW_RERUN_SECONDS:g}s are written to '{PROFILE_DIR}'")
+        if st.button("Reset timings", key="profiling_reset"):
+            phase_stats.clear()
+
+def show_memory_panel():
+    """Admin panel with the memory held by sessions and shared datasets"""
+    with st.sidebar.expander("🧠 Memory", expanded=False):
+        session_stats = session_reaper.stats()
+        datasets = dataset_registry.stats()
+        shared_mb = datasets['Memory (MB)'].sum()
+        private_mb = session_stats['private_bytes'] / 1024**2
+        st.markdown(f"""
+        • Sessions: {session_stats['sessions']} ({session_stats['with_data']} with data loaded)<br>
+        • Shared datasets: {len(datasets)} ({shared_mb:.1f} MB)<br>
+        • Session charts: {private_mb:.1f} MB<br>
+        • Total: {shared_mb + private_mb:.1f} MB<br>
+        • Idle or expired sessions freed: {session_stats['reaped']}
+        """, unsafe_allow_html=True)
+        if not datasets.empty:
+            st.dataframe(datasets.round(2), use_container_width=True, hide_index=True)
+        st.caption(f"Session data is freed after {SESSION_IDLE_TIMEOUT // 60} minutes of inactivity or when the login expires")
+
+def render_page(profiler: RerunProfiler):
+    """Header, upload, lookup and chart sections, timed by the rerun's profiler"""
+    resources = session_resources()
+    
     # Header with logout option
     col1, col2 = st.columns([4, 1])
     with col1:
@@ -191,6 +194,7 @@ def main_app():
         if st.button("🚪 Logout", type="secondary"):
             st.session_state.authenticated = False
             st.session_state.login_time = None
+            end_session()
             st.rerun()
     
     # Session info
@@ -216,6 +220,10 @@ def main_app():
                 st.error(f"❌ File too large. Maximum size allowed: {MAX_FILE_SIZE//1024//1024}MB")
                 uploaded_file = None
         
+        # Uploads and batch jobs queue for a worker; single lookups never do
+        queue_stats = work_queue.stats()
+        st.caption(f"⚙️ Server load: {queue_stats['running']} of {queue_stats['max_running']} workers busy, {queue_stats['waiting']} jobs queued")
+        
         # Sample data download
         st.markdown("---")
         st.subheader("📋 Sample Data")
@@ -256,37 +264,72 @@ def main_app():
     with col1:
         st.header("🔍 Data Lookup")
         
-        # Initialize session state
-        if 'data' not in st.session_state:
-            st.session_state.data = None
-        
         # Load data if file is uploaded
         if uploaded_file is not None:
             try:
-                data = pd.read_excel(uploaded_file)
-                if validate_data_structure(data):
-                    st.session_state.data = data
+                content = uploaded_file.getvalue()
+                data_hash = file_content_hash(content)
+                dataset = resources.dataset
+                # Only switch datasets when the file content changes
+                if dataset is None or dataset.content_hash != data_hash:
+                    # Sessions that uploaded the same table share its data, engine and model
+                    dataset = dataset_registry.acquire(data_hash)
+                    if dataset is None:
+                        progress_bar = st.progress(0.0, text="📥 Loading file...")
+                        
+                        def report_progress(rows_read, total_rows):
+                            fraction = min(rows_read / total_rows, 1.0) if total_rows else 0.0
+                            progress_bar.progress(fraction, text=f"📥 Loaded {rows_read:,} rows...")
+                        
+                        def report_queue_position(position):
+                            progress_bar.progress(0.0, text=f"⏳ Waiting for a free worker: position {position} in the queue...")
+                        
+                        # Parsing and indexing take a worker slot so bulk work cannot starve other users
+                        try:
+                            with work_queue.slot(st.session_state.session_key, on_wait=report_queue_position):
+                                with profiler.phase('parse'):
+                                    data = load_reference_table(content, data_hash, progress=report_progress)
+                                if validate_data_structure(data):
+                                    with profiler.phase('index'):
+                                        dataset = dataset_registry.acquire(data_hash, data)
+                        finally:
+                            progress_bar.empty()
+                    resources.release_dataset()
+                    resources.dataset = dataset
+                    resources.lookup_cache.invalidate()
+                
+                if dataset is not None:
                     st.success("✅ File loaded successfully!")
                     
                     # Display data info
                     st.markdown(f"""
                     <div class="metric-card">
                         <strong>📊 Data Summary:</strong><br>
-                        • Rows: {len(data)}<br>
-                        • Columns: {len(data.columns)}<br>
+                        • Rows: {len(dataset.data)}<br>
+                        • Columns: {len(dataset.data.columns)}<br>
                         • File: {uploaded_file.name}<br>
-                        • Size: {uploaded_file.size/1024:.1f} KB
+                        • Size: {uploaded_file.size/1024:.1f} KB<br>
+                        • Sessions sharing this table: {dataset_registry.references(data_hash)}
                     </div>
                     """, unsafe_allow_html=True)
+                    
+                    # Residuals of the fitted surface tell users how far it can be trusted
+                    model = dataset.model
+                    st.caption(
+                        f"📈 Surrogate model (degree {model.degree}): RMS residual {model.rms_residual:.4f}, "
+                        f"max residual {model.max_residual:.4f}, R² {model.r_squared:.4f}"
+                    )
                 else:
                     st.error("❌ Invalid data structure. Please ensure your Excel file has columns: 'Measured Density', 'Observed Temperature', 'Corresponding Density'")
-                    st.session_state.data = None
+            except AdmissionError as e:
+                st.warning(f"⏳ {e}")
             except Exception as e:
                 st.error(f"❌ Error loading file: {str(e)}")
-                st.session_state.data = None
+                resources.release_dataset()
         
         # Input fields
-        if st.session_state.data is not None:
+        dataset = resources.dataset
+        if dataset is not None:
             st.subheader("📝 Enter Values")
             
             col_density, col_temp = st.columns(2)
@@ -315,22 +358,51 @@ def main_app():
             
             # Lookup button
             if st.button("🔍 Find Corresponding Density", type="primary", use_container_width=True):
-                result = find_closest_match(st.session_state.data, measured_density, observed_temp)
+                with profiler.phase('lookup'):
+                    # Repeat lookups of the same inputs are answered from the cache
+                    result = resources.lookup_cache.lookup(
+                        dataset.engine,
+                        dataset.content_hash,
+                        measured_density,
+                        observed_temp
+                    )
                 
                 if result is not None:
                     corresponding_density, distance = result
                     
+                    # Engines that can interpolate also give an interpolated answer
+                    interpolated = dataset.engine.interpolate(measured_density, observed_temp)
+                    interpolated_line = (
+                        f"<br><strong>Interpolated Density:</strong> {interpolated:.4f}"
+                        if interpolated is not None else ""
+                    )
+                    
+                    # The fitted surface answers alongside the nearest match, unless it is the engine itself
+                    if dataset.engine.name == 'model':
+                        distance_text = "n/a (fitted model)"
+                        model_line = ""
+                    else:
+                        distance_text = f"{distance:.4f}"
+                        model_density = dataset.model.predict(measured_density, observed_temp)
+                        model_line = (
+                            f"<br><strong>Model Density:</strong> {model_density:.4f} "
+                            f"(RMS residual {dataset.model.rms_residual:.4f})"
+                        )
+                    
                     # Display result
                     st.markdown(f"""
                     <div class="success-message">
                         <h3>🎯 Result Found!</h3>
                         <strong>Corresponding Density:</strong> {corresponding_density:.4f}<br>
-                        <strong>Match Distance:</strong> {distance:.4f}
+                        <strong>Match Distance:</strong> {distance_text}{interpolated_line}{model_line}
                     </div>
                     """, unsafe_allow_html=True)
                     
+                    cache_stats = resources.lookup_cache.stats()
+                    st.caption(f"Lookup cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+                    
                     # Store result for visualization
-                    st.session_state.last_result = {
+                    resources.last_result = {
                         'measured_density': measured_density,
                         'observed_temp': observed_temp,
                         'corresponding_density': corresponding_density,
@@ -338,39 +410,105 @@ def main_app():
                     }
                 else:
                     st.error("❌ No matching data found for the given inputs")
+            
+            # Batch lookup
+            st.markdown("---")
+            st.subheader("📦 Batch Lookup")
+            batch_file = st.file_uploader(
+                "Choose a file of query pairs",
+                type=['csv', 'xlsx', 'xls'],
+                help=f"Upload a CSV or Excel file with columns: 'Measured Density', 'Observed Temperature'. Max size: {MAX_FILE_SIZE//1024//1024}MB",
+                key="batch_file"
+            )
+            
+            if batch_file is not None and batch_file.size > MAX_FILE_SIZE:
+                st.error(f"❌ File too large. Maximum size allowed: {MAX_FILE_SIZE//1024//1024}MB")
+                batch_file = None
+            
+            if batch_file is not None and st.button("📦 Run Batch Lookup", use_container_width=True):
+                try:
+                    queue_status = st.empty()
+                    
+                    def report_batch_position(position):
+                        queue_status.info(f"⏳ Waiting for a free worker: position {position} in the queue...")
+                    
+                    results = None
+                    with work_queue.slot(st.session_state.session_key, on_wait=report_batch_position):
+                        queue_status.empty()
+                        queries = load_batch_queries(batch_file)
+                        if all(col in queries.columns for col in QUERY_COLUMNS):
+                            with profiler.phase('batch'):
+                                results = parallel_batch_lookup(dataset.engine, queries)
+                    
+                    if results is not None:
+                        st.success(f"✅ Resolved {len(results)} query rows")
+                        st.dataframe(results.head(10), use_container_width=True, hide_index=True)
+                        
+                        st.download_button(
+                            label="Download batch_results.csv",
+                            data=results.to_csv(index=False).encode('utf-8'),
+                            file_name="batch_results.csv",
+                            mime="text/csv"
+                        )
+                    else:
+                        st.error("❌ Invalid query file. Please ensure it has columns: 'Measured Density', 'Observed Temperature'")
+                except AdmissionError as e:
+                    st.warning(f"⏳ {e}")
+                except Exception as e:
+                    st.error(f"❌ Error running batch lookup: {str(e)}")
         else:
             st.info("👆 Please upload an Excel file to begin")
     
     with col2:
         st.header("📈 Data Visualization")
         
-        if st.session_state.data is not None:
+        dataset = resources.dataset
+        if dataset is not None:
             # Get last result for visualization
-            last_result = st.session_state.get('last_result', None)
+            last_result = resources.last_result
             
-            if last_result:
-                fig = create_scatter_plot(
-                    st.session_state.data,
-                    last_result['measured_density'],
-                    last_result['observed_temp']
-                )
-            else:
-                fig = create_scatter_plot(st.session_state.data)
+            # The base figure is built once per dataset; lookups only move the input marker
+            with profiler.phase('figure'):
+                if resources.figure_hash != dataset.content_hash or resources.figure is None:
+                    resources.figure = session_figure(dataset.data, dataset.content_hash)
+                    resources.figure_hash = dataset.content_hash
+                fig = resources.figure
+                
+                if last_result:
+                    add_input_marker(fig, last_result['measured_density'], last_result['observed_temp'])
             
-            st.plotly_chart(fig, use_container_width=True)
+            with profiler.phase('chart'):
+                st.plotly_chart(fig, use_container_width=True)
+            if len(dataset.data) > LARGE_PLOT_ROWS:
+                st.caption("Large table: showing mean Corresponding Density per grid cell with a sample of the rows")
             
             # Data table
             st.subheader("📋 Data Preview")
-            st.dataframe(
-                st.session_state.data.head(10),
-                use_container_width=True,
-                hide_index=True
-            )
+            with profiler.phase('dataframe'):
+                st.dataframe(
+                    dataset.data.head(10),
+                    use_container_width=True,
+                    hide_index=True
+                )
             
-            if len(st.session_state.data) > 10:
-                st.caption(f"Showing first 10 rows of {len(st.session_state.data)} total rows")
+            if len(dataset.data) > 10:
+                st.caption(f"Showing first 10 rows of {len(dataset.data)} total rows")
         else:
             st.info("📊 Upload data to see visualization")
+
+def main_app():
+    """Main application interface"""
+    profiler = RerunProfiler()
+    profiler.start()
+    try:
+        render_page(profiler)
+    finally:
+        # Also runs when the rerun is cut short by st.rerun() or new user input,
+        # so those reruns are recorded and the profiler is always disabled
+        profiler.finish()
+    show_memory_panel()
+    if profiler.enabled:
+        show_profiling_panel()
     
     # Footer
     st.markdown("---")
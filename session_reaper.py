@@ -0,0 +1,135 @@
+"""
+Idle-session reaping for the Density-Temperature Lookup Application
+
+Streamlit keeps a session's state until its browser disconnects, and an app
+only notices an expired login when that session reruns. The heavy objects of
+a session are therefore kept here, keyed by a per-session key, where a
+background thread can release them once the session has been idle too long
+or its login has expired. A session that comes back simply starts with
+empty resources and reloads its table from the shared caches.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from density_lookup import LookupCache
+from plotting import figure_nbytes
+
+REAPER_INTERVAL_SECONDS = 60  # How often idle sessions are looked for
+
+
+class SessionResources:
+    """Heavy per-session objects: the shared dataset handle, chart and lookup results"""
+
+    def __init__(self):
+        self.dataset = None
+        self.figure = None
+        self.figure_hash = None
+        self.last_result = None
+        self.lookup_cache = LookupCache()
+        self.last_active = time.time()
+        self.idle_seconds = None
+        self.expires_at = None
+
+    def release_dataset(self):
+        """Drop the reference to the shared dataset"""
+        if self.dataset is not None:
+            self.dataset.release()
+            self.dataset = None
+
+    def release(self):
+        """Free everything this session holds"""
+        self.release_dataset()
+        self.figure = None
+        self.figure_hash = None
+        self.last_result = None
+        self.lookup_cache.invalidate()
+
+    def private_nbytes(self) -> int:
+        """Approximate memory held by this session alone; shared datasets are counted by the registry"""
+        return figure_nbytes(self.figure) if self.figure is not None else 0
+
+    def deadline(self) -> Optional[float]:
+        """Time after which the session is reaped, if any"""
+        deadlines = []
+        if self.idle_seconds:
+            deadlines.append(self.last_active + self.idle_seconds)
+        if self.expires_at:
+            deadlines.append(self.expires_at)
+        return min(deadlines) if deadlines else None
+
+
+class SessionReaper:
+    """Tracks session activity and frees the resources of idle or expired sessions"""
+
+    def __init__(self, interval: float = REAPER_INTERVAL_SECONDS):
+        self.interval = interval
+        self.sessions = {}
+        self.reaped = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def touch(self, session_key: str, idle_seconds: Optional[float] = None,
+              expires_at: Optional[float] = None) -> SessionResources:
+        """Resources of a session, marked as active now; called on every rerun"""
+        self.start()
+        with self.lock:
+            resources = self.sessions.get(session_key)
+            if resources is None:
+                resources = self.sessions[session_key] = SessionResources()
+            resources.last_active = time.time()
+            resources.idle_seconds = idle_seconds
+            resources.expires_at = expires_at
+            return resources
+
+    def remove(self, session_key: str):
+        """Free a session's resources right away, e.g. on logout"""
+        with self.lock:
+            resources = self.sessions.pop(session_key, None)
+        if resources is not None:
+            resources.release()
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """Free every session past its deadline; returns how many were freed"""
+        now = time.time() if now is None else now
+        with self.lock:
+            expired = [
+                key for key, resources in self.sessions.items()
+                if resources.deadline() is not None and now > resources.deadline()
+            ]
+            released = [self.sessions.pop(key) for key in expired]
+            self.reaped += len(released)
+
+        # Releasing drops dataset references, which takes the registry lock
+        for resources in released:
+            resources.release()
+        return len(released)
+
+    def start(self):
+        """Start the background thread once per process"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='session-reaper', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.reap()
+
+    def stats(self) -> dict:
+        with self.lock:
+            sessions = list(self.sessions.values())
+            reaped = self.reaped
+        return {
+            'sessions': len(sessions),
+            'with_data': sum(resources.dataset is not None for resources in sessions),
+            'private_bytes': sum(resources.private_nbytes() for resources in sessions),
+            'reaped': reaped
+        }
+
+
+# Shared by every session and rerun in this process
+session_reaper = SessionReaper()
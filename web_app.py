@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from typing import Optional, Tuple
 import io
+from density_lookup import QUERY_COLUMNS, LookupCache, validate_data_structure
+from data_loading import file_content_hash, load_reference_table
+from dataset_registry import dataset_registry
+from parallel_lookup import parallel_batch_lookup
+from plotting import LARGE_PLOT_ROWS, add_input_marker, session_figure
+from profiling import PROFILE_DIR, PROFILING_PANEL, SLOW_RERUN_SECONDS, RerunProfiler, phase_stats
 
 # Page configuration
 st.set_page_config(
@@ -48,70 +51,37 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def validate_data_structure(data: pd.DataFrame) -> bool:
-    """Validate that the data has the required columns"""
-    if data is None:
-        return False
-    required_columns = ['Measured Density', 'Observed Temperature', 'Corresponding Density']
-    return all(col in data.columns for col in required_columns)
+def load_batch_queries(uploaded_file) -> pd.DataFrame:
+    """Read a CSV or Excel file of query pairs"""
+    if uploaded_file.name.lower().endswith('.csv'):
+        return pd.read_csv(uploaded_file)
+    return pd.read_excel(uploaded_file)
 
-def find_closest_match(data: pd.DataFrame, measured_density: float, observed_temp: float) -> Optional[Tuple[float, float]]:
-    """Find the closest match based on Euclidean distance"""
-    if data is None or data.empty:
-        return None
-    
-    # Calculate distances
-    distances = np.sqrt(
-        (data['Measured Density'] - measured_density)**2 + 
-        (data['Observed Temperature'] - observed_temp)**2
-    )
-    
-    # Find minimum distance
-    min_idx = distances.idxmin()
-    min_distance = distances.iloc[min_idx]
-    
-    # Return corresponding density and distance
-    corresponding_density = data.loc[min_idx, 'Corresponding Density']
-    return corresponding_density, min_distance
+def release_dataset():
+    """Drop this session's reference to its shared dataset"""
+    if st.session_state.get('dataset') is not None:
+        st.session_state.dataset.release()
+        st.session_state.dataset = None
 
-def create_scatter_plot(data: pd.DataFrame, measured_density: float = None, observed_temp: float = None):
-    """Create an interactive scatter plot"""
-    fig = px.scatter(
-        data, 
-        x='Measured Density', 
-        y='Observed Temperature',
-        color='Corresponding Density',
-        size='Corresponding Density',
-        hover_data=['Corresponding Density'],
-        title='Density-Temperature Data Visualization',
-        color_continuous_scale='Viridis'
-    )
-    
-    # Add user input point if provided
-    if measured_density is not None and observed_temp is not None:
-        fig.add_trace(go.Scatter(
-            x=[measured_density],
-            y=[observed_temp],
-            mode='markers',
-            marker=dict(
-                color='red',
-                size=15,
-                symbol='x',
-                line=dict(width=3, color='darkred')
-            ),
-            name='Your Input',
-            hovertemplate=f'Your Input<br>Measured Density: {measured_density}<br>Observed Temperature: {observed_temp}<extra></extra>'
-        ))
-    
-    fig.update_layout(
-        width=800,
-        height=600,
-        showlegend=True
-    )
-    
-    return fig
+def show_profiling_panel():
+    """Read-only panel with rolling timings of each rerun phase
 
-def main():
+    This app has no login, so the panel is only shown with the operator's
+    DENSITY_PROFILING_PANEL switch and offers no reset for visitors.
+    """
+    with st.sidebar.expander("⏱️ Performance Profile", expanded=False):
+        summary = phase_stats.summary()
+        if summary.empty:
+            st.caption("No timings recorded yet")
+            return
+        st.dataframe(summary.round(2), use_container_width=True, hide_index=True)
+        phase = st.selectbox("Phase histogram", phase_stats.phases(), key="profiling_phase")
+        st.bar_chart(phase_stats.histogram(phase))
+        if SLOW_RERUN_SECONDS:
+            st.caption(f"cProfile dumps of reruns slower than {SLOW_RERUN_SECONDS:g}s are written to '{PROFILE_DIR}'")
+
+def render_page(profiler: RerunProfiler):
+    """Header, upload, lookup and chart sections, timed by the rerun's profiler"""
     # Header
     st.markdown('<h1 class="main-header">📊 Density-Temperature Lookup Application</h1>', unsafe_allow_html=True)
     
@@ -167,35 +137,67 @@ def main():
         st.header("🔍 Data Lookup")
         
         # Initialize session state
-        if 'data' not in st.session_state:
-            st.session_state.data = None
+        if 'dataset' not in st.session_state:
+            st.session_state.dataset = None
+        if 'lookup_cache' not in st.session_state:
+            st.session_state.lookup_cache = LookupCache()
         
         # Load data if file is uploaded
         if uploaded_file is not None:
             try:
-                data = pd.read_excel(uploaded_file)
-                if validate_data_structure(data):
-                    st.session_state.data = data
+                content = uploaded_file.getvalue()
+                data_hash = file_content_hash(content)
+                dataset = st.session_state.dataset
+                # Only switch datasets when the file content changes
+                if dataset is None or dataset.content_hash != data_hash:
+                    # Sessions that uploaded the same table share its data, engine and model
+                    dataset = dataset_registry.acquire(data_hash)
+                    if dataset is None:
+                        progress_bar = st.progress(0.0, text="📥 Loading file...")
+                        
+                        def report_progress(rows_read, total_rows):
+                            fraction = min(rows_read / total_rows, 1.0) if total_rows else 0.0
+                            progress_bar.progress(fraction, text=f"📥 Loaded {rows_read:,} rows...")
+                        
+                        with profiler.phase('parse'):
+                            data = load_reference_table(content, data_hash, progress=report_progress)
+                        progress_bar.empty()
+                        if validate_data_structure(data):
+                            with profiler.phase('index'):
+                                dataset = dataset_registry.acquire(data_hash, data)
+                    release_dataset()
+                    st.session_state.dataset = dataset
+                    st.session_state.lookup_cache.invalidate()
+                
+                if dataset is not None:
                     st.success("✅ File loaded successfully!")
                     
                     # Display data info
                     st.markdown(f"""
                     <div class="metric-card">
                         <strong>📊 Data Summary:</strong><br>
-                        • Rows: {len(data)}<br>
-                        • Columns: {len(data.columns)}<br>
-                        • File: {uploaded_file.name}
+                        • Rows: {len(dataset.data)}<br>
+                        • Columns: {len(dataset.data.columns)}<br>
+                        • File: {uploaded_file.name}<br>
+                        • Sessions sharing this table: {dataset_registry.references(data_hash)}
                     </div>
                     """, unsafe_allow_html=True)
+                    
+                    # Residuals of the fitted surface tell users how far it can be trusted
+                    model = dataset.model
+                    st.caption(
+                        f"📈 Surrogate model (degree {model.degree}): RMS residual {model.rms_residual:.4f}, "
+                        f"max residual {model.max_residual:.4f}, R² {model.r_squared:.4f}"
+                    )
                 else:
                     st.error("❌ Invalid data structure. Please ensure your Excel file has columns: 'Measured Density', 'Observed Temperature', 'Corresponding Density'")
-                    st.session_state.data = None
             except Exception as e:
                 st.error(f"❌ Error loading file: {str(e)}")
-                st.session_state.data = None
+                release_dataset()
         
         # Input fields
-        if st.session_state.data is not None:
+        dataset = st.session_state.dataset
+        if dataset is not None:
             st.subheader("📝 Enter Values")
             
             col_density, col_temp = st.columns(2)
@@ -224,20 +226,49 @@ def main():
             
             # Lookup button
             if st.button("🔍 Find Corresponding Density", type="primary", use_container_width=True):
-                result = find_closest_match(st.session_state.data, measured_density, observed_temp)
+                with profiler.phase('lookup'):
+                    # Repeat lookups of the same inputs are answered from the cache
+                    result = st.session_state.lookup_cache.lookup(
+                        dataset.engine,
+                        dataset.content_hash,
+                        measured_density,
+                        observed_temp
+                    )
                 
                 if result is not None:
                     corresponding_density, distance = result
                     
+                    # Engines that can interpolate also give an interpolated answer
+                    interpolated = dataset.engine.interpolate(measured_density, observed_temp)
+                    interpolated_line = (
+                        f"<br><strong>Interpolated Density:</strong> {interpolated:.4f}"
+                        if interpolated is not None else ""
+                    )
+                    
+                    # The fitted surface answers alongside the nearest match, unless it is the engine itself
+                    if dataset.engine.name == 'model':
+                        distance_text = "n/a (fitted model)"
+                        model_line = ""
+                    else:
+                        distance_text = f"{distance:.4f}"
+                        model_density = dataset.model.predict(measured_density, observed_temp)
+                        model_line = (
+                            f"<br><strong>Model Density:</strong> {model_density:.4f} "
+                            f"(RMS residual {dataset.model.rms_residual:.4f})"
+                        )
+                    
                     # Display result
                     st.markdown(f"""
                     <div class="success-message">
                         <h3>🎯 Result Found!</h3>
                         <strong>Corresponding Density:</strong> {corresponding_density:.4f}<br>
-                        <strong>Match Distance:</strong> {distance:.4f}
+                        <strong>Match Distance:</strong> {distance_text}{interpolated_line}{model_line}
                     </div>
                     """, unsafe_allow_html=True)
                     
+                    cache_stats = st.session_state.lookup_cache.stats()
+                    st.caption(f"Lookup cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+                    
                     # Store result for visualization
                     st.session_state.last_result = {
                         'measured_density': measured_density,
@@ -247,39 +278,87 @@ def main():
                     }
                 else:
                     st.error("❌ No matching data found for the given inputs")
+            
+            # Batch lookup
+            st.markdown("---")
+            st.subheader("📦 Batch Lookup")
+            batch_file = st.file_uploader(
+                "Choose a file of query pairs",
+                type=['csv', 'xlsx', 'xls'],
+                help="Upload a CSV or Excel file with columns: 'Measured Density', 'Observed Temperature'",
+                key="batch_file"
+            )
+            
+            if batch_file is not None and st.button("📦 Run Batch Lookup", use_container_width=True):
+                try:
+                    queries = load_batch_queries(batch_file)
+                    if all(col in queries.columns for col in QUERY_COLUMNS):
+                        with profiler.phase('batch'):
+                            results = parallel_batch_lookup(dataset.engine, queries)
+                        st.success(f"✅ Resolved {len(results)} query rows")
+                        st.dataframe(results.head(10), use_container_width=True, hide_index=True)
+                        
+                        st.download_button(
+                            label="Download batch_results.csv",
+                            data=results.to_csv(index=False).encode('utf-8'),
+                            file_name="batch_results.csv",
+                            mime="text/csv"
+                        )
+                    else:
+                        st.error("❌ Invalid query file. Please ensure it has columns: 'Measured Density', 'Observed Temperature'")
+                except Exception as e:
+                    st.error(f"❌ Error running batch lookup: {str(e)}")
         else:
             st.info("👆 Please upload an Excel file to begin")
     
     with col2:
         st.header("📈 Data Visualization")
         
-        if st.session_state.data is not None:
+        dataset = st.session_state.dataset
+        if dataset is not None:
             # Get last result for visualization
             last_result = st.session_state.get('last_result', None)
             
-            if last_result:
-                fig = create_scatter_plot(
-                    st.session_state.data,
-                    last_result['measured_density'],
-                    last_result['observed_temp']
-                )
-            else:
-                fig = create_scatter_plot(st.session_state.data)
+            # The base figure is built once per dataset; lookups only move the input marker
+            with profiler.phase('figure'):
+                if st.session_state.get('figure_hash') != dataset.content_hash or 'figure' not in st.session_state:
+                    st.session_state.figure = session_figure(dataset.data, dataset.content_hash)
+                    st.session_state.figure_hash = dataset.content_hash
+                fig = st.session_state.figure
+                
+                if last_result:
+                    add_input_marker(fig, last_result['measured_density'], last_result['observed_temp'])
             
-            st.plotly_chart(fig, use_container_width=True)
+            with profiler.phase('chart'):
+                st.plotly_chart(fig, use_container_width=True)
+            if len(dataset.data) > LARGE_PLOT_ROWS:
+                st.caption("Large table: showing mean Corresponding Density per grid cell with a sample of the rows")
             
             # Data table
             st.subheader("📋 Data Preview")
-            st.dataframe(
-                st.session_state.data.head(10),
-                use_container_width=True,
-                hide_index=True
-            )
+            with profiler.phase('dataframe'):
+                st.dataframe(
+                    dataset.data.head(10),
+                    use_container_width=True,
+                    hide_index=True
+                )
             
-            if len(st.session_state.data) > 10:
-                st.caption(f"Showing first 10 rows of {len(st.session_state.data)} total rows")
+            if len(dataset.data) > 10:
+                st.caption(f"Showing first 10 rows of {len(dataset.data)} total rows")
         else:
             st.info("📊 Upload data to see visualization")
+
+def main():
+    profiler = RerunProfiler()
+    profiler.start()
+    try:
+        render_page(profiler)
+    finally:
+        # Also runs when the rerun is cut short by st.rerun() or new user input,
+        # so those reruns are recorded and the profiler is always disabled
+        profiler.finish()
+    if profiler.enabled and PROFILING_PANEL:
+        show_profiling_panel()
     
     # Footer
     st.markdown("---")
@@ -0,0 +1,105 @@
+"""
+Admission control for expensive work in the Density-Temperature Lookup Application
+
+Parsing workbooks, building indexes and batch jobs each take a slot from a
+bounded pool before they run. Work beyond the pool waits in a FIFO queue,
+a per-user limit stops one session from filling it, and a full queue
+refuses new work outright. Single lookups never take a slot, so they never
+wait behind bulk work.
+
+Admitted work runs on the caller's own thread, so Streamlit elements such
+as progress bars keep working inside a slot.
+"""
+
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+QUEUE_POLL_SECONDS = 0.25  # How often a waiting caller is told its queue position
+
+
+class AdmissionError(RuntimeError):
+    """Raised when heavy work is refused instead of queued"""
+
+
+class WorkQueue:
+    """Bounded pool of slots for heavy work, shared by every session in the process"""
+
+    def __init__(self, max_running: int = 2, max_per_user: int = 1, max_waiting: int = 20):
+        self.max_running = max_running
+        self.max_per_user = max_per_user
+        self.max_waiting = max_waiting
+        self.running = 0
+        self.waiting = deque()
+        self.user_jobs = Counter()
+        self.condition = threading.Condition()
+
+    def configure(self, max_running: int, max_per_user: int, max_waiting: int):
+        """Apply limits from the app; safe to call on every rerun"""
+        with self.condition:
+            self.max_running = max_running
+            self.max_per_user = max_per_user
+            self.max_waiting = max_waiting
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, user: str, on_wait: Optional[Callable[[int], None]] = None):
+        """Hold a slot for the duration of the block, queueing for it if none is free
+
+        While it waits, on_wait is called from the caller's thread with its
+        1-based position in the queue. Must not be nested for the same user.
+        """
+        ticket = object()
+        with self.condition:
+            if self.user_jobs[user] >= self.max_per_user:
+                raise AdmissionError(
+                    f"You already have {self.user_jobs[user]} heavy job(s) running or queued. "
+                    "Please wait for them to finish."
+                )
+            if len(self.waiting) >= self.max_waiting:
+                raise AdmissionError(
+                    f"The server is busy: {len(self.waiting)} jobs are already waiting. Please try again shortly."
+                )
+            self.user_jobs[user] += 1
+            self.waiting.append(ticket)
+
+        admitted = False
+        try:
+            while True:
+                with self.condition:
+                    if self.running < self.max_running and self.waiting[0] is ticket:
+                        self.waiting.popleft()
+                        self.running += 1
+                        admitted = True
+                        # The next ticket may also fit if several slots are free
+                        self.condition.notify_all()
+                        break
+                    self.condition.wait(QUEUE_POLL_SECONDS)
+                    position = self.waiting.index(ticket) + 1
+                # UI updates happen outside the lock
+                if on_wait is not None:
+                    on_wait(position)
+            yield
+        finally:
+            with self.condition:
+                if admitted:
+                    self.running -= 1
+                else:
+                    self.waiting.remove(ticket)
+                self.user_jobs[user] -= 1
+                if not self.user_jobs[user]:
+                    del self.user_jobs[user]
+                self.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'running': self.running,
+                'waiting': len(self.waiting),
+                'max_running': self.max_running
+            }
+
+
+# Shared by every session and rerun in this process
+work_queue = WorkQueue()